@@ -4,20 +4,79 @@ Sets up Flask app, SocketIO, CORS, Firebase connection and Maps for server-use.
 """
 
 import os
+import atexit
+import queue
+import logging
+import logging.handlers
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 import firebase_admin
 from firebase_admin import credentials, firestore
 from flask import Flask
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_socketio import SocketIO
 from flask_cors import CORS
 
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for faster request/response handling."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        """Serializes an object to a JSON string."""
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        """Parses a JSON string or bytes."""
+        return orjson.loads(s)
+
+
+class ORJSONPacketCodec:
+    """json-compatible module for Socket.IO packets backed by orjson."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        """Serializes a packet payload to a compact JSON string (orjson output is always compact)."""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        """Parses a packet payload, raising ValueError on invalid JSON like the json module."""
+        return orjson.loads(s)
+
+
+def initialize_logging():
+    """Routes all logging through a queue so handlers never block on console output."""
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    root_logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    # A single background thread does the actual formatting and writing
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, console_handler)
+    listener.start()
+
+    # Flush anything still queued when the server exits
+    atexit.register(listener.stop)
+    return listener
+
+
 def initialize_firebase():
     """Sets up Firebase connection for database operations."""
     cred = credentials.Certificate("raw/fightsintheforest-firebase-adminsdk-fbsvc-c35c3cb72b.json")
     firebase_admin.initialize_app(cred)
     return firestore.client()
 
-# Create Flask app with CORS support
+# Set up non-blocking logging before anything else logs
+log_listener = initialize_logging()
+logger = logging.getLogger("server")
+
+# Create Flask app with CORS support and orjson serialization
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app, resources={
     r"/*": {
         "origins": ["http://127.0.0.1:8080"],
@@ -29,21 +88,28 @@ CORS(app, resources={
     }
 })
 
-# Configure SocketIO with settings for real-time game communication
+# Configure SocketIO with settings for real-time game communication.
+# Threading mode lets bcrypt/RSA work in one handler run alongside others.
+# Packets are encoded with orjson as well.
 socketio = SocketIO(
     app,
     cors_allowed_origins="http://127.0.0.1:8080",
-    async_mode='eventlet',
+    async_mode='threading',
     ping_timeout=25000,
     ping_interval=10000,
-    logger=True,
-    engineio_logger=True
+    json=ORJSONPacketCodec,
+    logger=logging.getLogger("socketio"),
+    engineio_logger=logging.getLogger("engineio")
 )
 
 # Initialize Firebase database connection
 db = initialize_firebase()
-print("Connected database")
+logger.info("Connected database")
+
+# Bounded worker pool for Firestore work started from socket handlers
+io_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="io")
 
-active_rooms = {}            # Maps room codes to lists of connected clients
+active_rooms = {}            # Maps room codes to dicts of connected clients keyed by username
+sid_index = {}               # Maps socket sids to (room code, client) entries of active_rooms
 active_turn_timers = {}      # Maps room codes to turn timer data
-disconnection_timers = {}    # Maps username_roomcode to disconnection timers
+disconnection_timers = {}    # Maps username_roomcode to pending removal deadlines
@@ -0,0 +1,9 @@
+"""
+Database package initialization for Firestore helpers.
+"""
+
+from .room_store import (field_path, create_room, release_room_code, get_room, invalidate_room)
+from .ability_store import load_abilities, get_ability_cached, format_ability_chat
+
+__all__ = ['field_path', 'create_room', 'release_room_code', 'get_room', 'invalidate_room',
+           'load_abilities', 'get_ability_cached', 'format_ability_chat']
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Firestore helpers for ability documents.
+
+Provides:
+- In-process caching of the ability collection
+- Ability lookup by name
+- Precompiled chat message templates
+"""
+
+import time
+from config import db
+
+# Seconds the ability collection is served from memory before re-reading it
+ABILITY_CACHE_TTL = 300
+
+# Ability documents and chat templates keyed by name, with the time they expire
+_ability_cache = {'expires': 0, 'abilities': {}, 'chat_templates': {}}
+
+
+def load_abilities():
+    """Return all ability documents keyed by name, re-reading the collection when stale."""
+    if _ability_cache['expires'] <= time.monotonic():
+        abilities = {}
+        chat_templates = {}
+        for doc in db.collection("ability").stream():
+            ability_data = doc.to_dict()
+            if "name" in ability_data:
+                abilities[ability_data["name"]] = ability_data
+                chat_templates[ability_data["name"]] = compile_chat_template(ability_data.get("chat", ""))
+
+        _ability_cache['abilities'] = abilities
+        _ability_cache['chat_templates'] = chat_templates
+        _ability_cache['expires'] = time.monotonic() + ABILITY_CACHE_TTL
+
+    return _ability_cache['abilities']
+
+
+def get_ability_cached(name):
+    """Return one ability document by name from the cache, or None if there is none."""
+    return load_abilities().get(name)
+
+
+def compile_chat_template(chat):
+    """Turns a chat text with [player1]/[player2] placeholders into a str.format_map template."""
+    # Escape literal braces first so only the placeholders are format fields
+    template = chat.replace("{", "{{").replace("}", "}}")
+    return template.replace("[player1]", "{player1}").replace("[player2]", "{player2}")
+
+
+def format_ability_chat(name, player1, player2):
+    """Fills an ability's cached chat template with the target and acting character names."""
+    load_abilities()
+    template = _ability_cache['chat_templates'].get(name, "")
+    return template.format_map({'player1': player1, 'player2': player2})
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Firestore helpers for room documents.
+
+Provides:
+- Escaped field paths for partial document updates
+- Room creation with locally tracked room codes
+- Short-lived in-process caching of room documents
+"""
+
+import copy
+import random
+import threading
+import time
+from google.api_core.exceptions import Conflict
+from google.cloud.firestore_v1.field_path import FieldPath
+from config import db
+
+_used_room_codes = None               # Room codes known to exist, loaded on first use
+_room_codes_lock = threading.Lock()
+
+# Seconds a room document is served from memory before re-reading it
+ROOM_CACHE_TTL = 0.5
+
+_room_cache = {}                      # Maps room codes to (expiry time, room data) of existing rooms
+_room_generations = {}                # Maps room codes to how often they were invalidated
+_room_cache_lock = threading.Lock()
+_next_cache_sweep = 0.0               # When expired cache entries are next dropped
+
+
+def field_path(*parts):
+    """Builds a Firestore field path, escaping parts such as usernames that contain dots."""
+    return FieldPath(*parts).to_api_repr()
+
+
+def _load_used_room_codes():
+    """Returns the set of existing room codes, listing the rooms collection only once."""
+    global _used_room_codes
+    with _room_codes_lock:
+        if _used_room_codes is None:
+            _used_room_codes = {doc.id for doc in db.collection('rooms').list_documents()}
+        return _used_room_codes
+
+
+def create_room(room_data):
+    """Creates a room document under an unused 4-digit code and returns the code."""
+    used_codes = _load_used_room_codes()
+    while True:
+        with _room_codes_lock:
+            if len(used_codes) >= 9000:
+                raise ValueError("No free room codes")
+
+            # Pick a random code locally instead of reading Firestore per attempt
+            room_code = str(random.randint(1000, 9999))
+            while room_code in used_codes:
+                room_code = str(random.randint(1000, 9999))
+            used_codes.add(room_code)
+
+        try:
+            # create() fails if another server created the same room meanwhile
+            db.collection('rooms').document(room_code).create(dict(room_data, code=room_code))
+            return room_code
+        except Conflict:
+            continue
+
+
+def release_room_code(room_code):
+    """Marks a room code as free again after its room document is deleted."""
+    with _room_codes_lock:
+        if _used_room_codes is not None:
+            _used_room_codes.discard(room_code)
+
+
+def get_room(room_code, readonly=False):
+    """
+    Returns a copy of a room's data, or None if it does not exist, reading Firestore only when stale.
+    With readonly=True the cached dict itself is returned, and the caller must not modify it.
+    """
+    with _room_cache_lock:
+        cached = _room_cache.get(room_code)
+        if cached is not None and cached[0] <= time.monotonic():
+            del _room_cache[room_code]
+            cached = None
+        generation = _room_generations.get(room_code, 0)
+
+    if cached is not None:
+        room_data = cached[1]
+    else:
+        room_doc = db.collection('rooms').document(room_code).get()
+        if not room_doc.exists:
+            # Misses are not cached, so unknown codes sent by clients take no memory
+            return None
+        room_data = room_doc.to_dict()
+        _store_fill(room_code, generation, room_data)
+
+    # Callers that modify the data they get must never receive the cached dict itself
+    if readonly:
+        return room_data
+    return copy.deepcopy(room_data)
+
+
+def _store_fill(room_code, generation, room_data):
+    """Caches a freshly read room, unless the room was invalidated while it was being read."""
+    global _next_cache_sweep
+    now = time.monotonic()
+    with _room_cache_lock:
+        # A read that raced with a write would otherwise put its older snapshot back
+        if _room_generations.get(room_code, 0) != generation:
+            return
+        _room_cache[room_code] = (now + ROOM_CACHE_TTL, room_data)
+
+        # Drop expired entries of rooms nobody reads any more
+        if now >= _next_cache_sweep:
+            _next_cache_sweep = now + ROOM_CACHE_TTL
+            for expired_code in [code for code, entry in _room_cache.items() if entry[0] <= now]:
+                del _room_cache[expired_code]
+
+
+def invalidate_room(room_code):
+    """Drops a cached room after a partial update so the next read fetches it again."""
+    with _room_cache_lock:
+        _room_generations[room_code] = _room_generations.get(room_code, 0) + 1
+        _room_cache.pop(room_code, None)
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Room-wide notification helper shared by socket events and HTTP routes.
+"""
+
+from config import socketio, active_rooms
+from security.encryption_utils import encrypt_for_recipients
+
+
+def broadcast(event, payload, room_code, skip_sid=None):
+    """Encrypts a payload for every connected client in a room, except skip_sid, and emits it to each of them."""
+    # Copy the clients, other handler threads may join or leave meanwhile
+    clients = [client for client in list(active_rooms.get(room_code, {}).values()) if client.get("sid") != skip_sid]
+    if not clients:
+        return
+
+    # The AES step runs once, only the key wrap is per recipient
+    packages = encrypt_for_recipients(payload, [client.get("username") for client in clients])
+
+    # Group sockets that receive the very same package (e.g. the symmetric fallback)
+    recipients = {}
+    for client in clients:
+        client_username = client.get("username")
+        sid = client.get("sid")
+        if client_username and sid:
+            package = packages[client_username]
+            recipients.setdefault(id(package), (package, []))[1].append(sid)
+
+    # A list of sids is a multi-room emit, so a shared package is encoded only once
+    for package, sids in recipients.values():
+        socketio.emit(event, package, to=sids if len(sids) > 1 else sids[0])
\ No newline at end of file
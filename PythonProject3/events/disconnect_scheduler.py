@@ -0,0 +1,67 @@
+"""
+Scheduler for removing players some time after they disconnect.
+
+Pending removals are kept in a single heap serviced by one background task,
+instead of starting a timer thread for every disconnect.
+"""
+
+import heapq
+import itertools
+import threading
+import logging
+import time
+from config import socketio, disconnection_timers
+
+logger = logging.getLogger(__name__)
+
+_pending_removals = []               # Heap of (deadline, sequence, timer_key, callback, args)
+_sequence = itertools.count()        # Tie-breaker so heap entries never compare callbacks
+_condition = threading.Condition()
+_worker_started = False
+
+
+def schedule_removal(timer_key, delay, callback, *args):
+    """Schedules callback(*args) to run after delay seconds, replacing any pending removal for the key."""
+    global _worker_started
+
+    deadline = time.monotonic() + delay
+    with _condition:
+        # Older heap entries for this key become no-ops once the deadline changes
+        disconnection_timers[timer_key] = deadline
+        heapq.heappush(_pending_removals, (deadline, next(_sequence), timer_key, callback, args))
+
+        if not _worker_started:
+            _worker_started = True
+            socketio.start_background_task(_run_removals)
+
+        _condition.notify()
+
+
+def cancel_removal(timer_key):
+    """Cancels a pending removal, for example when the player reconnects."""
+    with _condition:
+        disconnection_timers.pop(timer_key, None)
+
+
+def _run_removals():
+    """Runs due removals in deadline order, sleeping until the next one is due."""
+    while True:
+        with _condition:
+            while True:
+                now = time.monotonic()
+                if _pending_removals and _pending_removals[0][0] <= now:
+                    break
+                timeout = _pending_removals[0][0] - now if _pending_removals else None
+                _condition.wait(timeout)
+
+            deadline, _, timer_key, callback, args = heapq.heappop(_pending_removals)
+
+            # Skip entries that were cancelled or rescheduled
+            if disconnection_timers.get(timer_key) != deadline:
+                continue
+            del disconnection_timers[timer_key]
+
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Error running scheduled removal for %s", timer_key)
\ No newline at end of file
@@ -1,27 +1,57 @@
 """
 Game logic and event handlers for gameplay mechanics.
 """
+import logging
 import time
-import traceback
-from config import socketio, db, active_rooms, active_turn_timers, disconnection_timers
-from security.encryption_utils import (encrypt_response, decrypt_request, encrypt_for_database, decrypt_from_database)
+import threading
+import orjson
+from firebase_admin import firestore
+from config import socketio, db, io_pool, active_rooms, active_turn_timers
+from database.ability_store import get_ability_cached, format_ability_chat
+from database.room_store import get_room, invalidate_room
+from events.broadcast import broadcast
+from events.disconnect_scheduler import cancel_removal
+from events.state_versions import (TRACKED_FIELDS, current_version, bump_version, changed_since,
+                                   cached_sync_payload, cache_sync_payload)
+from security.encryption_utils import (encrypt_response, decrypt_request, encrypt_for_database, decrypt_from_database,
+                                       crypto_pool)
+
+logger = logging.getLogger(__name__)
+
+# The two teams of a room, each a dict mapping usernames to character names
+GROUP_NAMES = ('group1', 'group2')
+
+# Messages kept in a room's chat log, older ones are dropped
+CHAT_LOG_LIMIT = 200
+
+# Reconnect attempts a player gets per second, and how many may come in a burst
+RECONNECT_RATE = 1.0
+RECONNECT_BURST = 3
+
+_reconnect_buckets = {}      # Maps (username, room code) to (tokens, last refill time)
+_reconnect_lock = threading.Lock()
+_next_bucket_sweep = 0.0     # When fully refilled reconnect buckets are next dropped
+
+_acting_rooms = set()        # Room codes with a move or skip being processed
+_acting_lock = threading.Lock()
 
 
 def start_first_turn(room_code):
     """Initiates the first turn for a new game using the room's configured player order."""
     room_ref = db.collection('rooms').document(room_code)
-    room_doc = room_ref.get()
-    room_data = room_doc.to_dict()
+    room_data = get_room(room_code, readonly=True)
 
     current_turn = room_data['game_state']['turn']
     player_order = room_data['game_state']['player_order']
 
     # Select first active player and determine who goes next
     current_player = player_order[current_turn % len(player_order)]
-    next_player = find_next_active_player(room_code, current_player, player_order)
-    room_data['game_state']['current_player'] = current_player
-    room_data['game_state']['next_player'] = next_player
-    room_ref.set(room_data)
+    next_player = pick_next_active_player(room_data, current_player, player_order)
+    room_ref.update({
+        'game_state.current_player': current_player,
+        'game_state.next_player': next_player
+    })
+    invalidate_room(room_code)
 
     # Start timer for the first player's turn
     start_turn_timer(room_code, current_player, next_player)
@@ -32,9 +62,14 @@ def find_next_active_player(room_code, current_player, player_order):
     if not player_order or len(player_order) <= 1:
         return ""
 
-    room_ref = db.collection('rooms').document(room_code)
-    room_doc = room_ref.get()
-    room_data = room_doc.to_dict()
+    return pick_next_active_player(get_room(room_code, readonly=True), current_player, player_order)
+
+
+def pick_next_active_player(room_data, current_player, player_order):
+    """Locates the next undefeated player in sequence using already loaded room data."""
+    order_length = len(player_order) if player_order else 0
+    if order_length <= 1:
+        return ""
 
     # Get decrypted health data
     character_health = room_data.get('character_health', {})
@@ -48,14 +83,129 @@ def find_next_active_player(room_code, current_player, player_order):
         current_index = -1
 
     # Check each player in order until we find an active one
-    for i in range(1, len(player_order) + 1):
-        next_index = (current_index + i) % len(player_order)
+    players = room_data['players']
+    for i in range(1, order_length + 1):
+        next_index = (current_index + i) % order_length
         next_player = player_order[next_index]
         if next_player in character_health:
-            if character_health[next_player] > 0 and next_player in room_data['players']:
+            if character_health[next_player] > 0 and next_player in players:
                 return next_player
 
 
+def chat_log_update(room_data, new_entries):
+    """Returns the chat_log update that appends new entries while keeping at most CHAT_LOG_LIMIT of them."""
+    chat_log = room_data.get('chat_log', [])
+    if len(chat_log) + len(new_entries) <= CHAT_LOG_LIMIT:
+        return firestore.ArrayUnion(new_entries)
+
+    # Drop the oldest entries once the log is full
+    return (chat_log + new_entries)[-CHAT_LOG_LIMIT:]
+
+
+def serialize_reconnection_sync(room_data, turn_data, event, changed_fields, base_version):
+    """
+    Builds a reconnection sync and returns it as JSON bytes. A full sync carries every
+    tracked field, a delta carries only changed_fields in its patch.
+    """
+    sync_fields = TRACKED_FIELDS if changed_fields is None else changed_fields
+    state = {}
+
+    # Each room field is looked up once, and only when it is sent (no default dict is built for present fields)
+    # Decrypt character_health if needed
+    if 'character_health' in sync_fields:
+        character_health = room_data.get('character_health') or {}
+        if isinstance(character_health, dict) and character_health.get("encrypted", False):
+            character_health = decrypt_from_database(character_health)
+        state['character_health'] = character_health
+
+    for group_name in GROUP_NAMES:
+        if group_name in sync_fields:
+            state[group_name] = room_data.get(group_name) or {}
+
+    # Decrypt chat log for reconnection sync
+    if 'chat_log' in sync_fields:
+        chat_log = []
+        chat_entries = room_data.get('chat_log')
+        if chat_entries:
+            # Get the last 20 messages
+            recent_chat = chat_entries[-20:]
+            for chat_entry in recent_chat:
+                if isinstance(chat_entry, dict) and chat_entry.get("encrypted", False):
+                    decrypted_entry = decrypt_from_database(chat_entry)
+                    chat_log.append(decrypted_entry)
+                else:
+                    chat_log.append(chat_entry)
+        state['chat_log'] = chat_log
+
+    if changed_fields is None:
+        # Prepare reconnection data with complete game state
+        reconnection_data = dict(turn_data, event=event, **state)
+    else:
+        reconnection_data = dict(turn_data, event=event, base_version=base_version, patch=state)
+
+    return orjson.dumps(reconnection_data, option=orjson.OPT_NON_STR_KEYS)
+
+
+def send_encrypted(event, data, username, sid):
+    """Encrypts data for one user and emits it to their socket (runs on the crypto pool)."""
+    try:
+        socketio.emit(event, encrypt_response(data, username), to=sid)
+    except Exception:
+        logger.exception("Error sending %s", event)
+
+
+def index_player_groups(room_data):
+    """Maps every grouped player's username to 'group1' or 'group2'."""
+    player_group = dict.fromkeys(room_data.get('group1', {}), 'group1')
+    player_group.update(dict.fromkeys(room_data.get('group2', {}), 'group2'))
+    return player_group
+
+
+def allow_reconnect(username, room_code):
+    """Takes a token from the player's reconnect bucket, returning False when they reconnect too often."""
+    global _next_bucket_sweep
+    now = time.monotonic()
+    key = (username, room_code)
+    with _reconnect_lock:
+        # Buckets that have refilled completely behave like missing ones, so drop them now and then
+        if now >= _next_bucket_sweep:
+            _next_bucket_sweep = now + RECONNECT_BURST / RECONNECT_RATE
+            for idle_key in [bucket_key for bucket_key, (bucket_tokens, bucket_time) in _reconnect_buckets.items()
+                             if bucket_tokens + (now - bucket_time) * RECONNECT_RATE >= RECONNECT_BURST]:
+                del _reconnect_buckets[idle_key]
+
+        tokens, last_time = _reconnect_buckets.get(key, (RECONNECT_BURST, now))
+        tokens = min(RECONNECT_BURST, tokens + (now - last_time) * RECONNECT_RATE)
+        if tokens < 1:
+            _reconnect_buckets[key] = (tokens, now)
+            return False
+        _reconnect_buckets[key] = (tokens - 1, now)
+        return True
+
+
+def forget_reconnect_buckets(room_code):
+    """Drops the reconnect buckets of a room once it is freed."""
+    with _reconnect_lock:
+        for key in [key for key in _reconnect_buckets if key[1] == room_code]:
+            del _reconnect_buckets[key]
+
+
+def record_turn(room_code, current_player, next_player):
+    """Stores a room's current and next players in its turn state, keeping any timer data."""
+    timer_data = dict(active_turn_timers.get(room_code) or {})
+    timer_data['current_player'] = current_player
+    timer_data['next_player'] = next_player
+    active_turn_timers[room_code] = timer_data
+
+
+def cached_turn_players(room_code):
+    """Returns the (current, next) players of a room's running turn, or (None, None) if no turn is running."""
+    timer_data = active_turn_timers.get(room_code)
+    if not timer_data:
+        return None, None
+    return timer_data.get('current_player'), timer_data.get('next_player')
+
+
 def start_turn_timer(room_code, current_player, next_player):
     """Sets up a 60-second timer for the current player's turn and notifies all players."""
     # Cancel any existing timer for this room
@@ -77,27 +227,30 @@ def start_turn_timer(room_code, current_player, next_player):
     }
 
     # Notify all clients that turn has started
-    if room_code in active_rooms:
-        notification_data = {
-            'current_player': current_player,
-            'next_player': next_player,
-            'start_time': start_time,
-            'duration': 60,
-            'event': 'turn_started'
-        }
-
-        for client in active_rooms[room_code]:
-            client_username = client.get("username")
-            sid = client.get("sid")
-            if client_username and sid:
-                encrypted_notification = encrypt_response(notification_data, client_username)
-                socketio.emit('turn_started', encrypted_notification, to=sid)
+    notification_data = {
+        'current_player': current_player,
+        'next_player': next_player,
+        'start_time': start_time,
+        'duration': 60,
+        'event': 'turn_started'
+    }
+    broadcast('turn_started', notification_data, room_code)
 
 
 def next_turn(room_code):
     """Advances the game to the next player's turn, ensuring we skip defeated players."""
     room_ref = db.collection('rooms').document(room_code)
-    room_doc = room_ref.get()
+
+    # Read and bump the turn atomically so racing moves or timers never lose a turn
+    players = advance_turn(db.transaction(), room_ref)
+    invalidate_room(room_code)
+    return players
+
+
+@firestore.transactional
+def advance_turn(transaction, room_ref):
+    """Moves a room to its next turn inside a transaction and returns the new current and next players."""
+    room_doc = room_ref.get(transaction=transaction)
     room_data = room_doc.to_dict()
 
     if room_data['game_state']['status'] != 'started':
@@ -116,19 +269,72 @@ def next_turn(room_code):
     else:
         current_player = player_order[current_turn % len(player_order)]
 
-    # Find next active player
-    next_player = find_next_active_player(room_code, current_player, player_order)
-
-    # Update current_player and next_player in game state
-    room_data['game_state']['current_player'] = current_player
-    room_data['game_state']['next_player'] = next_player
+    # Find next active player from the same snapshot
+    next_player = pick_next_active_player(room_data, current_player, player_order)
 
-    # Save the updated player order and player references
-    room_ref.set(room_data)
+    # Save the turn number and player references
+    transaction.update(room_ref, {
+        'game_state.turn': current_turn,
+        'game_state.current_player': current_player,
+        'game_state.next_player': next_player
+    })
 
     return current_player, next_player
 
 
+def claim_action(room_code):
+    """Marks a move or skip as in progress in a room, returning False if another one already is."""
+    with _acting_lock:
+        if room_code in _acting_rooms:
+            return False
+        _acting_rooms.add(room_code)
+        return True
+
+
+def release_action(room_code):
+    """Ends the move or skip in progress in a room."""
+    with _acting_lock:
+        _acting_rooms.discard(room_code)
+
+
+def save_action(room_code, room_ref, updates, changed_fields, end_notification, event, notification):
+    """
+    Saves a finished move or skip, then announces the game end or advances to the next turn.
+    The turn is advanced before returning, so a retried action fails the turn check;
+    only the fanout and the timer restart run on the I/O pool.
+    """
+    room_ref.update(updates)
+    invalidate_room(room_code)
+    bump_version(room_code, *changed_fields)
+
+    # Only announce the game end once it is saved, a failed write leaves the game running
+    if end_notification is not None:
+        io_pool.submit(broadcast, 'game_ended', end_notification, room_code)
+        return
+
+    # Turn advancement reads the saved turn order, so it runs after the write
+    current_player, next_player = next_turn(room_code)
+    notification['current_player'] = current_player
+    notification['next_player'] = next_player
+
+    # Record the new turn before anyone hears of it, so a quick next player passes the in-memory turn check
+    record_turn(room_code, current_player, next_player)
+
+    io_pool.submit(announce_turn, room_code, event, notification)
+
+
+def announce_turn(room_code, event, notification):
+    """Announces a finished action and starts the next turn's timer (runs on the I/O pool)."""
+    try:
+        broadcast(event, notification, room_code)
+
+        # Start the next turn's timer
+        start_turn_timer(room_code, notification['current_player'], notification['next_player'])
+
+    except Exception:
+        logger.exception("Error announcing turn in room %s", room_code)
+
+
 @socketio.on('game_started')
 def on_game_started(data):
     """Handles game initialization when all players are ready to start."""
@@ -139,7 +345,7 @@ def on_game_started(data):
         # Start the first turn
         start_first_turn(room_code)
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error handling game_started")
 
 
 @socketio.on('get_ability')
@@ -155,13 +361,12 @@ def on_get_ability(data):
             error_response = {'error': 'Missing ability name or username'}
             return encrypt_response(error_response, username)
 
-        ability_docs = db.collection("ability").where('name', '==', ability_name).limit(1).get()
+        ability_data = get_ability_cached(ability_name)
 
-        if not ability_docs or len(ability_docs) == 0:
+        if ability_data is None:
             error_response = {'error': 'Ability not found'}
             return encrypt_response(error_response, username)
 
-        ability_data = ability_docs[0].to_dict()
         ability_type = ability_data.get("type", "")
         ability_desc = ability_data.get("desc", "")
         num_dice = ability_data.get("num", "")
@@ -177,7 +382,7 @@ def on_get_ability(data):
         return encrypt_response(response_data, username)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error handling get_ability")
         error_response = {'error': 'Error processing ability'}
         return encrypt_response(error_response, username) if username else error_response
 
@@ -185,6 +390,7 @@ def on_get_ability(data):
 @socketio.on('make_move')
 def on_make_move(data):
     """Processes a player's combat action, updates health values, and advances to the next turn."""
+    claimed_room = None
     try:
         request_json = decrypt_request(data)
 
@@ -201,6 +407,18 @@ def on_make_move(data):
             error_response = {'error': 'Missing required fields'}
             return encrypt_response(error_response, username)
 
+        # One action per room at a time, so a double-click cannot pass the turn checks twice
+        if not claim_action(room_code):
+            error_response = {'error': 'Not your turn'}
+            return encrypt_response(error_response, username)
+        claimed_room = room_code
+
+        # Reject out-of-turn requests from the in-memory turn state before reading the room
+        expected_player, _ = cached_turn_players(room_code)
+        if expected_player is not None and expected_player != username:
+            error_response = {'error': 'Not your turn'}
+            return encrypt_response(error_response, username)
+
         # Cancel the timer for this room
         if room_code in active_turn_timers:
             timer = active_turn_timers[room_code].get('timer')
@@ -209,14 +427,12 @@ def on_make_move(data):
 
         # Get room data
         room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+        room_data = get_room(room_code)
 
-        if not room_doc.exists:
+        if room_data is None:
             error_response = {'error': 'Room not found'}
             return encrypt_response(error_response, username)
 
-        room_data = room_doc.to_dict()
-
         # Decrypt character_health if it's encrypted
         character_health = room_data.get('character_health', {})
         if isinstance(character_health, dict) and character_health.get("encrypted", False):
@@ -240,33 +456,21 @@ def on_make_move(data):
             error_response = {'error': 'Not your turn'}
             return encrypt_response(error_response, username)
 
-        # Get ability details
-        ability_docs = db.collection("ability").where('name', '==', ability).limit(1).get()
+        # Get ability details from the in-process cache
+        ability_data = get_ability_cached(ability)
 
-        if not ability_docs or len(ability_docs) == 0:
+        if ability_data is None:
             error_response = {'error': 'Ability not found'}
             return encrypt_response(error_response, username)
 
-        ability_data = ability_docs[0].to_dict()
-        chat_message = ability_data.get("chat", "")
-
-        # Replace placeholders in chat message
-        chat_message = chat_message.replace("[player1]", target)
-        chat_message = chat_message.replace("[player2]", character)
+        # Fill the ability's precompiled chat template in one pass
+        chat_message = format_ability_chat(ability, target, character)
 
-        # Identify target player's group and username
-        target_group = None
+        # Index every player's group once instead of scanning both groups per lookup
+        player_group = index_player_groups(room_data)
 
-        for player_username, character_name in room_data.get('group1', {}).items():
-            if player_username == target_player:
-                target_group = 'group1'
-                break
-
-        if target_group is None:
-            for player_username, character_name in room_data.get('group2', {}).items():
-                if player_username == target_player:
-                    target_group = 'group2'
-                    break
+        # Identify target player's group
+        target_group = player_group.get(target_player)
 
         if target_group is None:
             error_response = {'error': 'Target not found'}
@@ -291,9 +495,8 @@ def on_make_move(data):
 
         room_data['character_health'][target_player] = new_health
 
-        # Add to chat log if not already there
-        if 'chat_log' not in room_data:
-            room_data['chat_log'] = []
+        # Only the fields this move changes are written back
+        updates = {}
 
         # Create chat entry and always encrypt it
         chat_entry = {
@@ -303,49 +506,44 @@ def on_make_move(data):
         }
 
         # Always encrypt the chat entry before storing
-        encrypted_chat_entry = encrypt_for_database(chat_entry)
-        room_data['chat_log'].append(encrypted_chat_entry)
+        new_chat_entries = [encrypt_for_database(chat_entry)]
 
         if new_health <= 0:
             if target_player and target_player in room_data['game_state']['player_order']:
                 if target_player in room_data['game_state']['next_player']:
                     room_data['game_state']['next_player'] = find_next_active_player(room_code, target_player, room_data['game_state']['player_order'])
+                    updates['game_state.next_player'] = room_data['game_state']['next_player']
                 room_data['game_state']['player_order'].remove(target_player)
-
-        # Check if game is over (all players in a group defeated)
-        group1_all_dead = True
-        group2_all_dead = True
-
-        for player_username in room_data.get('group1', {}):
-            if player_username in room_data['character_health'] and room_data['character_health'][player_username] > 0:
-                group1_all_dead = False
-                break
-
-        for player_username in room_data.get('group2', {}):
-            if player_username in room_data['character_health'] and room_data['character_health'][player_username] > 0:
-                group2_all_dead = False
-                break
-
-        # Check if round limit reached
+                updates['game_state.player_order'] = firestore.ArrayRemove([target_player])
+
+        # Total each group's health and whether anyone in it is alive in one pass
+        group1_health = 0
+        group2_health = 0
+        group1_alive = False
+        group2_alive = False
+
+        for player_username, health in room_data['character_health'].items():
+            health_group = player_group.get(player_username)
+            if health_group == 'group1':
+                group1_health += health
+                group1_alive = group1_alive or health > 0
+            elif health_group == 'group2':
+                group2_health += health
+                group2_alive = group2_alive or health > 0
+
+        # Check if game is over (all players in a group defeated) or round limit reached
         game_over = False
+        end_notification = None
         winner = None
 
-        if group1_all_dead:
+        if not group1_alive:
             game_over = True
             winner = 'group2'
-        elif group2_all_dead:
+        elif not group2_alive:
             game_over = True
             winner = 'group1'
         elif current_turn >= len(room_data['character_health']) * 15:
             game_over = True
-            group1_health = 0
-            group2_health = 0
-
-            for player_username, health in room_data['character_health'].items():
-                if player_username in room_data.get('group1', {}):
-                    group1_health += health
-                elif player_username in room_data.get('group2', {}):
-                    group2_health += health
 
             if group1_health > group2_health:
                 winner = 'group1'
@@ -360,11 +558,10 @@ def on_make_move(data):
                 'message': f"Game over! Winner: {winner}",
                 'turn': current_turn
             }
-            encrypted_end_message = encrypt_for_database(end_message)
-            room_data['chat_log'].append(encrypted_end_message)
+            new_chat_entries.append(encrypt_for_database(end_message))
 
-            room_data['game_state']['status'] = 'ended'
-            room_data['game_state']['winner'] = winner
+            updates['game_state.status'] = 'ended'
+            updates['game_state.winner'] = winner
 
             # Notify all players about game end
             end_notification = {
@@ -372,61 +569,45 @@ def on_make_move(data):
                 'winner': winner
             }
 
-            for client in active_rooms[room_code]:
-                client_username = client.get("username")
-                sid = client.get("sid")
-                if client_username and sid:
-                    encrypted_notification = encrypt_response(end_notification, client_username)
-                    socketio.emit('game_ended', encrypted_notification, to=sid)
-
         # Encrypt character_health before storing
-        room_data['character_health'] = encrypt_for_database(room_data['character_health'])
-
-        # Save updated room data
-        room_ref.set(room_data)
-
-        # If game not over, advance to next turn
-        if not game_over:
-            current_player, next_player = next_turn(room_code)
-            move_notification = {
-                'event': 'move_made',
-                'username': username,
-                'ability': ability,
-                'target': target,
-                'effect': effect_message,
-                'chat': chat_message,
-                'health': {
-                    target_player: new_health,
-                    'character_name': target
-                },
-                'current_player': current_player,
-                'next_player': next_player
+        updates['character_health'] = encrypt_for_database(room_data['character_health'])
+        updates['chat_log'] = chat_log_update(room_data, new_chat_entries)
+
+        move_notification = {
+            'event': 'move_made',
+            'username': username,
+            'ability': ability,
+            'target': target,
+            'effect': effect_message,
+            'chat': chat_message,
+            'health': {
+                target_player: new_health,
+                'character_name': target
             }
+        }
 
-            for client in active_rooms[room_code]:
-                client_username = client.get("username")
-                sid = client.get("sid")
-
-                if client_username and sid:
-                    encrypted_notification = encrypt_response(move_notification, client_username)
-                    socketio.emit('move_made', encrypted_notification, to=sid)
-
-            # Start the next turn's timer
-            start_turn_timer(room_code, current_player, next_player)
+        # Save the changed fields and move on to the next turn
+        save_action(room_code, room_ref, updates, ('character_health', 'chat_log'), end_notification,
+                    'move_made', move_notification)
 
         # Prepare response
         response_data = {'success': True}
         return encrypt_response(response_data, username)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error handling make_move")
         error_response = {'error': 'Error making move: {str(e)}'}
         return encrypt_response(error_response, username) if username else error_response
 
+    finally:
+        if claimed_room is not None:
+            release_action(claimed_room)
+
 
 @socketio.on('skip_turn')
 def on_skip_turn(data):
     """Allows a player to skip their turn without making any moves."""
+    claimed_room = None
     try:
         request_json = decrypt_request(data)
         username = request_json.get('username')
@@ -436,6 +617,18 @@ def on_skip_turn(data):
             error_response = {'error': 'Missing required fields'}
             return encrypt_response(error_response, username)
 
+        # One action per room at a time, so a double-click cannot pass the turn checks twice
+        if not claim_action(room_code):
+            error_response = {'error': 'Not your turn'}
+            return encrypt_response(error_response, username)
+        claimed_room = room_code
+
+        # Reject out-of-turn requests from the in-memory turn state before reading the room
+        expected_player, _ = cached_turn_players(room_code)
+        if expected_player is not None and expected_player != username:
+            error_response = {'error': 'Not your turn'}
+            return encrypt_response(error_response, username)
+
         # Cancel the timer for this room
         if room_code in active_turn_timers:
             timer = active_turn_timers[room_code].get('timer')
@@ -444,9 +637,11 @@ def on_skip_turn(data):
 
         # Get room data
         room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+        room_data = get_room(room_code)
 
-        room_data = room_doc.to_dict()
+        if room_data is None:
+            error_response = {'error': 'Room not found'}
+            return encrypt_response(error_response, username)
 
         # Decrypt character_health if it's encrypted
         character_health = room_data.get('character_health', {})
@@ -454,17 +649,6 @@ def on_skip_turn(data):
             character_health = decrypt_from_database(character_health)
             room_data['character_health'] = character_health
 
-        # Decrypt chat_log if it exists and is encrypted
-        if 'chat_log' in room_data:
-            chat_log = []
-            for entry in room_data['chat_log']:
-                if isinstance(entry, dict) and entry.get("encrypted", False):
-                    decrypted_entry = decrypt_from_database(entry)
-                    chat_log.append(decrypted_entry)
-                else:
-                    chat_log.append(entry)
-            room_data['chat_log'] = chat_log
-
         # Check if it's this player's turn
         current_turn = room_data['game_state']['turn']
         player_order = room_data['game_state']['player_order']
@@ -482,40 +666,31 @@ def on_skip_turn(data):
             error_response = {'error': 'Not your turn'}
             return encrypt_response(error_response, username)
 
-        # Add skip entry to chat log
-        if 'chat_log' not in room_data:
-            room_data['chat_log'] = []
+        # Only the fields this skip changes are written back
+        updates = {}
 
+        # Add skip entry to chat log
         skip_entry = {
             'message': f"{username} skipped their turn",
             'turn': current_turn
         }
 
         # Encrypt the skip entry
-        encrypted_skip_entry = encrypt_for_database(skip_entry)
-        room_data['chat_log'].append(encrypted_skip_entry)
+        new_chat_entries = [encrypt_for_database(skip_entry)]
 
         # Check for round limit/game end condition
         game_over = False
+        end_notification = None
 
         if current_turn >= len(room_data['character_health']) * 15:
             game_over = True
             group1_health = 0
             group2_health = 0
 
-            for character, health in room_data['character_health'].items():
-                char_group = None
-                for player_username, char_name in room_data.get('group1', {}).items():
-                    if char_name == character:
-                        char_group = 'group1'
-                        break
-
-                if char_group is None:
-                    for player_username, char_name in room_data.get('group2', {}).items():
-                        if char_name == character:
-                            char_group = 'group2'
-                            break
-
+            # character_health is keyed by username, like the groups
+            player_group = index_player_groups(room_data)
+            for player_username, health in room_data['character_health'].items():
+                char_group = player_group.get(player_username)
                 if char_group == 'group1':
                     group1_health += health
                 elif char_group == 'group2':
@@ -534,11 +709,10 @@ def on_skip_turn(data):
                     'message': f"Game over! Winner: {winner}",
                     'turn': current_turn
                 }
-                encrypted_end_message = encrypt_for_database(end_message)
-                room_data['chat_log'].append(encrypted_end_message)
+                new_chat_entries.append(encrypt_for_database(end_message))
 
-                room_data['game_state']['status'] = 'ended'
-                room_data['game_state']['winner'] = winner
+                updates['game_state.status'] = 'ended'
+                updates['game_state.winner'] = winner
 
                 # Notify all players about game end with encryption
                 end_notification = {
@@ -546,53 +720,29 @@ def on_skip_turn(data):
                     'winner': winner
                 }
 
-                for client in active_rooms[room_code]:
-                    client_username = client.get("username")
-                    sid = client.get("sid")
-
-                    if client_username and sid:
-                        encrypted_notification = encrypt_response(end_notification, client_username)
-                        socketio.emit('game_ended', encrypted_notification, to=sid)
-
-        # Encrypt character health before saving
-        room_data['character_health'] = encrypt_for_database(room_data['character_health'])
-
-        # Save updated room data
-        room_ref.set(room_data)
-
-        # If game not over, advance to next turn
-        if not game_over:
-            # Get the next players
-            current_player, next_player = next_turn(room_code)
-
-            # Notify clients about skip
-            skip_notification = {
-                'event': 'skip_made',
-                'username': username,
-                'current_player': current_player,
-                'next_player': next_player
-            }
-
-            for client in active_rooms[room_code]:
-                client_username = client.get("username")
-                sid = client.get("sid")
+        # Skipping never changes health, so only the chat log and game state are saved
+        updates['chat_log'] = chat_log_update(room_data, new_chat_entries)
 
-                if client_username and sid:
-                    encrypted_notification = encrypt_response(skip_notification, client_username)
-                    socketio.emit('skip_made', encrypted_notification, to=sid)
-
-            # Start the next turn's timer
-            start_turn_timer(room_code, current_player, next_player)
+        # Notify clients about skip
+        skip_notification = {
+            'event': 'skip_made',
+            'username': username
+        }
+        save_action(room_code, room_ref, updates, ('chat_log',), end_notification, 'skip_made', skip_notification)
 
         # Prepare response
         response_data = {'success': True}
         return encrypt_response(response_data, username)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error handling skip_turn")
         error_response = {'error': 'Error skipping turn'}
         return encrypt_response(error_response, username) if username else error_response
 
+    finally:
+        if claimed_room is not None:
+            release_action(claimed_room)
+
 
 @socketio.on('get_game_state')
 def on_get_game_state(data):
@@ -607,15 +757,13 @@ def on_get_game_state(data):
             error_response = {'error': 'Missing room code or username'}
             return encrypt_response(error_response, username)
 
-        room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+        # The state is only read here, so skip the defensive copy
+        room_data = get_room(room_code, readonly=True)
 
-        if not room_doc.exists:
+        if room_data is None:
             error_response = {'error': 'Room not found'}
             return encrypt_response(error_response, username)
 
-        room_data = room_doc.to_dict()
-
         # Decrypt character_health if needed
         character_health = room_data.get('character_health', {})
         if isinstance(character_health, dict) and character_health.get("encrypted", False):
@@ -652,7 +800,11 @@ def on_get_game_state(data):
             game_state['current_player'] = room_data.get('game_state', {}).get('current_player')
             game_state['next_player'] = room_data.get('game_state', {}).get('next_player')
 
-            # If current_player or next_player are not set, calculate them
+            # If current_player or next_player are not set, use the running turn first
+            if not game_state['current_player'] or not game_state['next_player']:
+                game_state['current_player'], game_state['next_player'] = cached_turn_players(room_code)
+
+            # Otherwise calculate them
             if not game_state['current_player'] or not game_state['next_player']:
                 player_order = room_data.get('game_state', {}).get('player_order', [])
                 if player_order:
@@ -668,7 +820,7 @@ def on_get_game_state(data):
         return encrypt_response(response_data, username)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error handling get_game_state")
         error_response = {'error': 'Error getting game state'}
         return encrypt_response(error_response, username) if username else error_response
 
@@ -685,34 +837,34 @@ def on_reconnect_to_game(data):
         if not username or not room_code:
             return
 
-        # Check if this player's timer is active and cancel it
-        timer_key = f"{username}_{room_code}"
-        if timer_key in disconnection_timers:
-            disconnection_timers[timer_key].cancel()
-            del disconnection_timers[timer_key]
+        # Cancel this player's pending disconnect removal, even when the sync below is throttled
+        cancel_removal(f"{username}_{room_code}")
 
-        room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
-
-        if not room_doc.exists:
+        # Only players connected to the room are synced, checked in memory before charging a bucket
+        client = active_rooms.get(room_code, {}).get(username)
+        if client is None:
             return
 
-        room_data = room_doc.to_dict()
-        game_state = room_data.get('game_state', {})
-
-        status = game_state.get('status')
-        player_order = game_state.get('player_order', [])
+        # Drop reconnect storms before reading or encrypting any room state
+        if not allow_reconnect(username, room_code):
+            logger.debug("Throttled reconnect_to_game from %s in room %s", username, room_code)
+            return
 
-        if status != 'started':
+        # The state is only read here, so skip the defensive copy
+        room_data = get_room(room_code, readonly=True)
+        if room_data is None:
             return
 
-        in_group = False
-        for group_name in ['group1', 'group2']:
-            if group_name in room_data and username in room_data[group_name]:
-                in_group = True
-                break
+        # Only known rooms get a version, read again after taking it so the data sent is at least as new
+        state_version = current_version(room_code)
+        room_data = get_room(room_code, readonly=True)
+        if room_data is None:
+            return
+        game_state = room_data.get('game_state') or {}
+        status = game_state.get('status')
 
-        if not in_group:
+        # Only players of a running game are synced
+        if status != 'started' or not any(username in room_data.get(group_name, ()) for group_name in GROUP_NAMES):
             return
 
         current_turn = game_state.get('turn', 0)
@@ -721,6 +873,10 @@ def on_reconnect_to_game(data):
         next_player = game_state.get('next_player', '')
 
         if not current_player or not next_player:
+            current_player, next_player = cached_turn_players(room_code)
+
+        if not current_player or not next_player:
+            player_order = game_state.get('player_order')
             if player_order:
                 current_player = player_order[current_turn % len(player_order)]
                 next_player = find_next_active_player(room_code, current_player, player_order)
@@ -730,54 +886,47 @@ def on_reconnect_to_game(data):
 
         # Get turn timer info if available
         turn_timer_info = {}
-        if room_code in active_turn_timers:
-            timer_data = active_turn_timers[room_code]
+        timer_data = active_turn_timers.get(room_code)
+        if timer_data is not None:
+            # start_turn_timer always stores both times, so the clock is only read as a fallback
+            start_time = timer_data.get('start_time')
+            if start_time is None:
+                start_time = int(time.time())
             turn_timer_info = {
-                'start_time': timer_data.get('start_time', int(time.time())),
-                'end_time': timer_data.get('end_time', int(time.time()) + 60),
+                'start_time': start_time,
+                'end_time': timer_data.get('end_time', start_time + 60),
                 'duration': 60
             }
 
-        # Decrypt character_health if needed
-        character_health = room_data.get('character_health', {})
-        if isinstance(character_health, dict) and character_health.get("encrypted", False):
-            character_health = decrypt_from_database(character_health)
+        # Clients that send the state version they already have only get the fields changed since
+        base_version = request_json.get('client_state_version')
+        changed_fields = changed_since(room_code, base_version)
+        if changed_fields is None:
+            event = 'reconnection_sync'
+            base_version = None
         else:
-            character_health = room_data.get('character_health', {})
+            event = 'reconnection_sync_delta'
 
-        # Decrypt chat log for reconnection sync
-        chat_log = []
-        if 'chat_log' in room_data and room_data['chat_log']:
-            # Get the last 20 messages
-            recent_chat = room_data['chat_log'][-20:]
-            for chat_entry in recent_chat:
-                if isinstance(chat_entry, dict) and chat_entry.get("encrypted", False):
-                    decrypted_entry = decrypt_from_database(chat_entry)
-                    chat_log.append(decrypted_entry)
-                else:
-                    chat_log.append(chat_entry)
-
-        # Prepare reconnection data with complete game state
-        reconnection_data = {
-            'event': 'reconnection_sync',
+        # Turn data is small and always sent
+        turn_data = {
             'current_player': current_player,
             'next_player': next_player,
-            'character_health': character_health,
-            'group1': room_data.get('group1', {}),
-            'group2': room_data.get('group2', {}),
-            'chat_log': chat_log,
             'turn_timer': turn_timer_info,
             'game_status': status,
-            'turn': current_turn
+            'turn': current_turn,
+            'state_version': state_version
         }
 
-        # Find the player's socket and send the sync data with encryption
-        if room_code in active_rooms:
-            for client in active_rooms[room_code]:
-                if client.get("username") == username:
-                    encrypted_sync = encrypt_response(reconnection_data, username)
-                    socketio.emit('reconnection_sync', encrypted_sync, to=client.get("sid"))
-                    break
+        # Players reconnecting to the same state share one plaintext, only the encryption is per user
+        sync_key = (event, base_version, state_version, current_player, next_player, current_turn,
+                    turn_timer_info.get('start_time'), turn_timer_info.get('end_time'))
+        payload = cached_sync_payload(room_code, sync_key)
+        if payload is None:
+            payload = serialize_reconnection_sync(room_data, turn_data, event, changed_fields, base_version)
+            cache_sync_payload(room_code, sync_key, payload)
+
+        # Encrypt and send the sync data on the crypto pool, it is the largest payload this server sends
+        crypto_pool.submit(send_encrypted, event, payload, username, client.get("sid"))
 
     except Exception:
-        traceback.print_exc()
\ No newline at end of file
+        logger.exception("Error handling reconnect_to_game")
\ No newline at end of file
@@ -2,61 +2,87 @@
 Socket event handlers for real-time communication.
 """
 
-import threading
-import time
 import random
-import traceback
+import logging
+from firebase_admin import firestore
 from flask import request
-from config import socketio, db, active_rooms, active_turn_timers, disconnection_timers
-from security.encryption_utils import (encrypt_response, decrypt_request, encrypt_for_database, decrypt_from_database)
-from events.game_handlers import next_turn, start_turn_timer
+from google.api_core.exceptions import NotFound
+from config import socketio, db, io_pool, active_rooms, sid_index, active_turn_timers
+from database.room_store import field_path, invalidate_room
+from events.disconnect_scheduler import schedule_removal, cancel_removal
+from events.state_versions import bump_version, forget_room
+from events.game_handlers import forget_reconnect_buckets
+from security.encryption_utils import (decrypt_request, encrypt_for_database, decrypt_from_database)
+from events.broadcast import broadcast
 
+logger = logging.getLogger(__name__)
 
-def check_all_ready(room_data, room_code):
-    """Checks if all players are ready and starts the game if conditions are met."""
+# Seconds a disconnected player has to reconnect before being removed
+DISCONNECT_GRACE_PERIOD = 10.0
+
+
+def all_ready(room_data):
+    """Returns True if a room has enough players in both groups and all of them are ready."""
     # Ensure ready_players and players are in the data
     if 'ready_players' not in room_data or 'players' not in room_data:
-        return
+        return False
 
     # Ensure the player limitation
     if not room_data['players']:
-        return
+        return False
     if len(room_data['players']) < 2:
-        return
-    if len(room_data['group1']) < 1 or len(room_data['group2']) < 1:
-        return
-    if set(room_data['ready_players']) != set(room_data['players']):
-        return
+        return False
+    if len(room_data.get('group1', {})) < 1 or len(room_data.get('group2', {})) < 1:
+        return False
+    # Both lists are kept duplicate-free, so a size mismatch means not everyone is ready
+    if len(room_data['ready_players']) != len(room_data['players']):
+        return False
+    return set(room_data['ready_players']) == set(room_data['players'])
 
-    # All conditions met, start the game
+
+def check_all_ready(room_code):
+    """Checks if all players are ready and starts the game if conditions are met."""
+    # Decide inside the transaction from a fresh read: a cached copy could miss a player who readied
+    # at the same time, and among players pressing ready together only one transaction starts the game
     room_ref = db.collection('rooms').document(room_code)
-    room_data['game_state']['status'] = 'started'
+    if start_game(db.transaction(), room_ref):
+        invalidate_room(room_code)
+
+        # Emit game_started event to all clients in the room with encryption
+        broadcast('game_started', {'event': 'game_started'}, room_code)
+
+
+@firestore.transactional
+def start_game(transaction, room_ref):
+    """Starts a room's game inside a transaction, returning False if it already started or is not ready."""
+    room_doc = room_ref.get(transaction=transaction)
+    if not room_doc.exists:
+        return False
+
+    room_data = room_doc.to_dict()
+    if room_data.get('game_state', {}).get('status') == 'started' or not all_ready(room_data):
+        return False
 
-    # Set player order
+    # Set player order (at least two players are guaranteed above)
     player_list = list(room_data['players'])
     random.shuffle(player_list)
-    room_data['game_state']['player_order'] = player_list
-    room_data['game_state']['current_player'] = player_list[0]
-    room_data['game_state']['next_player'] = player_list[1]
 
+    # Only the game_state fields change, so leave the rest of the document alone
+    updates = {
+        'game_state.status': 'started',
+        'game_state.player_order': player_list,
+        'game_state.current_player': player_list[0],
+        'game_state.next_player': player_list[1]
+    }
 
     # Make sure character_health is encrypted
     if 'character_health' in room_data:
         if not (isinstance(room_data['character_health'], dict) and room_data['character_health'].get("encrypted", False)):
-            room_data['character_health'] = encrypt_for_database(room_data['character_health'])
+            updates['character_health'] = encrypt_for_database(room_data['character_health'])
 
     # Save the room data
-    room_ref.set(room_data)
-
-    # Emit game_started event to all clients in the room with encryption
-    if room_code in active_rooms:
-        notification_data = {'event': 'game_started'}
-        for client in active_rooms[room_code]:
-            client_username = client.get("username")
-            sid = client.get("sid")
-            if client_username and sid:
-                encrypted_notification = encrypt_response(notification_data, client_username)
-                socketio.emit('game_started', encrypted_notification, to=sid)
+    transaction.update(room_ref, updates)
+    return True
 
 
 @socketio.on('connect')
@@ -75,40 +101,35 @@ def on_join(data):
 
         # Initialize room in active_rooms if it doesn't exist
         if room_code not in active_rooms:
-            active_rooms[room_code] = []
+            active_rooms[room_code] = {}
 
-        # Check if there's a pending disconnect timer for this user and cancel it as so
-        timer_key = f"{username}_{room_code}"
-        if timer_key in disconnection_timers:
-            disconnection_timers[timer_key].cancel()
-            del disconnection_timers[timer_key]
+        # Cancel any pending disconnect removal for this user
+        cancel_removal(f"{username}_{room_code}")
 
         # Add the user to the room/update their sid
-        already_in_room = False
-        for client in active_rooms[room_code]:
-            if client.get("username") == username:
-                client["sid"] = request.sid
-                already_in_room = True
-                break
-
-        # Add if user not in room
-        if not already_in_room:
-            active_rooms[room_code].append({"sid": request.sid, "username": username})
+        room_client = active_rooms[room_code].get(username)
+        if room_client is not None:
+            # Make sure a replaced socket is no longer mapped to this player
+            if room_client.get("sid") != request.sid:
+                sid_index.pop(room_client.get("sid"), None)
+            room_client["sid"] = request.sid
+        else:
+            # Add if user not in room
+            room_client = {"sid": request.sid, "username": username}
+            active_rooms[room_code][username] = room_client
+
+        sid_index[request.sid] = (room_code, room_client)
 
         # Notify all users in the room with encryption
-        for client in active_rooms[room_code]:
-            sid = client.get("sid")
-            client_username = client.get("username")
-            if sid and client_username:
-                notification_data = {
-                    'username': username,
-                    'room_code': room_code
-                }
-                encrypted_notification = encrypt_response(notification_data, client_username)
-                socketio.emit('new_player', encrypted_notification, to=sid)
+        notification_data = {
+            'username': username,
+            'room_code': room_code
+        }
+        # The joining player already knows they joined
+        broadcast('new_player', notification_data, room_code, skip_sid=request.sid)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error handling join_room")
 
 
 @socketio.on('join_group')
@@ -117,39 +138,30 @@ def on_join_group(data):
     try:
         request_json = decrypt_request(data)
 
+        # Firestore work and fanout run on the I/O pool so the socket thread returns
+        io_pool.submit(apply_join_group, request_json)
+
+    except Exception:
+        logger.exception("Error handling join_group")
+
+
+def apply_join_group(request_json):
+    """Saves a player's group choice and notifies the room (runs on the I/O pool)."""
+    try:
         username = request_json.get('username')
         room_code = request_json.get('room_code')
         group = request_json.get('group')
         character_name = request_json.get('character_name')
 
-        # Update room in Firebase
-        room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
-
-        if room_doc.exists:
-            room_data = room_doc.to_dict()
-
-            # Decrypt character_health if it's encrypted
-            character_health = room_data.get('character_health', {})
-            if isinstance(character_health, dict) and character_health.get("encrypted", False):
-                character_health = decrypt_from_database(character_health)
-                room_data['character_health'] = character_health
-
-            # Set the user's character health
-            if 'character_health' not in room_data:
-                room_data['character_health'] = {}
-            if username not in room_data['character_health']:
-                room_data['character_health'][username] = 50
-            room_data['character_health'] = encrypt_for_database(room_data['character_health'])
-
-            # Remove player from other group if they exist, and remember their character
-            for g in ['group1', 'group2']:
-                if g in room_data and username in room_data[g]:
-                    del room_data[g][username]
+        if group not in ('group1', 'group2'):
+            return
 
-            # Add player to the specified group
-            room_data[group][username] = character_name
-            room_ref.set(room_data)
+        # Read and update the room atomically so concurrent group changes are not lost
+        room_ref = db.collection('rooms').document(room_code)
+        moved = move_to_group(db.transaction(), room_ref, username, group, character_name)
+        invalidate_room(room_code)
+        if moved:
+            bump_version(room_code, 'group1', 'group2', 'character_health')
 
             # Prepare notification data
             notification_data = {
@@ -160,16 +172,40 @@ def on_join_group(data):
             }
 
             # Emit group change event to all in the room with encryption
-            if room_code in active_rooms:
-                for client in active_rooms[room_code]:
-                    client_username = client.get("username")
-                    sid = client.get("sid")
-                    if client_username and sid:
-                        encrypted_notification = encrypt_response(notification_data, client_username)
-                        socketio.emit('group_change', encrypted_notification, to=sid)
+            broadcast('group_change', notification_data, room_code)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error applying group change")
+
+
+@firestore.transactional
+def move_to_group(transaction, room_ref, username, group, character_name):
+    """Moves a player into a group inside a transaction, returning False if the room is missing."""
+    room_doc = room_ref.get(transaction=transaction)
+    if not room_doc.exists:
+        return False
+
+    room_data = room_doc.to_dict()
+
+    # Move the player into the chosen group with field-level updates
+    updates = {
+        field_path(g, username): firestore.DELETE_FIELD
+        for g in ('group1', 'group2') if g != group
+    }
+    updates[field_path(group, username)] = character_name
+
+    # Decrypt character_health if it's encrypted
+    character_health = room_data.get('character_health', {})
+    if isinstance(character_health, dict) and character_health.get("encrypted", False):
+        character_health = decrypt_from_database(character_health)
+
+    # Set the user's character health
+    if username not in character_health:
+        character_health[username] = 50
+        updates['character_health'] = encrypt_for_database(character_health)
+
+    transaction.update(room_ref, updates)
+    return True
 
 
 @socketio.on('press_ready')
@@ -178,41 +214,40 @@ def on_press_ready(data):
     try:
         request_json = decrypt_request(data)
 
+        io_pool.submit(apply_press_ready, request_json, request.sid)
+
+    except Exception:
+        logger.exception("Error handling press_ready")
+
+
+def apply_press_ready(request_json, sid):
+    """Saves a player's ready status, notifies the room and checks for game start (runs on the I/O pool)."""
+    try:
         username = request_json.get('username')
         room_code = request_json.get('room_code')
 
-        # Update room in Firebase
+        # Add player to the ready list atomically in Firebase
         room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
-
-        if room_doc.exists:
-            room_data = room_doc.to_dict()
-
-            # Add player to ready list if not already there
-            if username not in room_data['ready_players']:
-                room_data['ready_players'].append(username)
-            room_ref.set(room_data)
+        try:
+            room_ref.update({'ready_players': firestore.ArrayUnion([username])})
+        except NotFound:
+            return
+        invalidate_room(room_code)
 
-            # Prepare notification data
-            notification_data = {
-                'username': username,
-                'room_code': room_code
-            }
+        # Prepare notification data
+        notification_data = {
+            'username': username,
+            'room_code': room_code
+        }
 
-            # Emit ready status to all in the room with encryption
-            if room_code in active_rooms:
-                for client in active_rooms[room_code]:
-                    client_username = client.get("username")
-                    sid = client.get("sid")
-                    if client_username and sid:
-                        encrypted_notification = encrypt_response(notification_data, client_username)
-                        socketio.emit('player_ready', encrypted_notification, to=sid)
+        # Emit ready status to the rest of the room with encryption
+        broadcast('player_ready', notification_data, room_code, skip_sid=sid)
 
-            # Check if game can start
-            check_all_ready(room_data, room_code)
+        # Check if game can start using the updated room
+        check_all_ready(room_code)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error applying ready status")
 
 
 @socketio.on('unpress_ready')
@@ -221,144 +256,144 @@ def on_unpress_ready(data):
     try:
         request_json = decrypt_request(data)
 
-        username = request_json.get('username')
-        room_code = request_json.get('room_code')
+        io_pool.submit(apply_unpress_ready, request_json, request.sid)
 
-        # Update room in Firebase
-        room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+    except Exception:
+        logger.exception("Error handling unpress_ready")
 
-        if room_doc.exists:
-            room_data = room_doc.to_dict()
 
-            # Remove player from ready list if they exist
-            if username in room_data['ready_players']:
-                room_data['ready_players'].remove(username)
+def apply_unpress_ready(request_json, sid):
+    """Clears a player's ready status and notifies the room (runs on the I/O pool)."""
+    try:
+        username = request_json.get('username')
+        room_code = request_json.get('room_code')
 
-            room_ref.set(room_data)
+        # Remove player from the ready list atomically in Firebase
+        room_ref = db.collection('rooms').document(room_code)
+        try:
+            room_ref.update({'ready_players': firestore.ArrayRemove([username])})
+        except NotFound:
+            return
+        invalidate_room(room_code)
 
-            # Prepare notification data
-            notification_data = {
-                'username': username,
-                'room_code': room_code
-            }
+        # Prepare notification data
+        notification_data = {
+            'username': username,
+            'room_code': room_code
+        }
 
-            # Emit unready status to all in the room with encryption
-            if room_code in active_rooms:
-                for client in active_rooms[room_code]:
-                    client_username = client.get("username")
-                    sid = client.get("sid")
-                    if client_username and sid:
-                        encrypted_notification = encrypt_response(notification_data, client_username)
-                        socketio.emit('player_unready', encrypted_notification, to=sid)
+        # Emit unready status to the rest of the room with encryption
+        broadcast('player_unready', notification_data, room_code, skip_sid=sid)
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error clearing ready status")
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handles player disconnection by scheduling their removal after a timeout period."""
     # Find which player disconnected by looking up their sid
-    sid = request.sid
+    disconnected_room, client = sid_index.pop(request.sid, (None, None))
     disconnected_username = None
-    disconnected_room = None
-
-    # Search through all rooms to find the disconnected user
-    for room_code, clients in active_rooms.items():
-        for client in clients:
-            if client.get("sid") == sid:
-                disconnected_username = client.get("username")
-                disconnected_room = room_code
-                active_rooms[room_code].remove(client)
-                break
-        if disconnected_username:
-            break
+
+    if client is not None:
+        disconnected_username = client.get("username")
+        room_clients = active_rooms.get(disconnected_room, {})
+        if room_clients.get(disconnected_username) is client:
+            del room_clients[disconnected_username]
 
     # If we found the disconnected user, schedule their removal from the room
     if disconnected_username and disconnected_room:
         try:
-            # Cancel any existing removal timer for this user in this room
+            # Replaces any pending removal for this user in this room
             timer_key = f"{disconnected_username}_{disconnected_room}"
-            if timer_key in disconnection_timers:
-                # Cancel existing timer
-                existing_timer = disconnection_timers[timer_key]
-                existing_timer.cancel()
-
-            # Create a new timer to remove the player after 10 seconds
-            def remove_player():
-                try:
-                    # Check if player reconnected (their username should be in active_rooms for this room)
-                    if disconnected_room in active_rooms:
-                        for client in active_rooms[disconnected_room]:
-                            if client.get("username") == disconnected_username:
-                                break
-
-                        # Call remove_player_from_room function
-                        room_ref = db.collection('rooms').document(disconnected_room)
-                        room_doc = room_ref.get()
-
-                        if room_doc.exists:
-                            room_data = room_doc.to_dict()
-                            game_state = room_data.get('game_state', {})
-
-                            # Only remove if game hasn't ended
-                            if game_state.get('status') != 'ended':
-                                room_changed = False
-
-                                # Remove player from various room components
-                                if 'players' in room_data and disconnected_username in room_data['players']:
-                                    room_data['players'].remove(disconnected_username)
-                                    room_changed = True
-
-                                # Find and remove their character
-                                for group in ['group1', 'group2']:
-                                    if group in room_data and disconnected_username in room_data[group]:
-                                        del room_data[group][disconnected_username]
-                                        room_changed = True
-
-                                # Remove their character's health
-                                if disconnected_username and 'character_health' in room_data:
-                                    if disconnected_username in room_data['character_health']:
-                                        del room_data['character_health'][disconnected_username]
-                                if 'ready_players' in room_data and disconnected_username in room_data['ready_players']:
-                                    room_data['ready_players'].remove(disconnected_username)
-                                    room_changed = True
-                                if 'game_state' in room_data and 'player_order' in room_data['game_state'] and disconnected_username in room_data['game_state']['player_order']:
-                                    room_data['game_state']['player_order'].remove(disconnected_username)
-                                    room_changed = True
-
-                                # Update room if changes were made
-                                if room_changed:
-                                    room_ref.set(room_data)
-
-                                    # Notify remaining players
-                                    notification_data = {
-                                        'type': 'player_left',
-                                        'username': disconnected_username,
-                                        'room_code': disconnected_room,
-                                        'reason': 'disconnected'
-                                    }
-
-                                    for client in active_rooms[disconnected_room]:
-                                        client_username = client.get("username")
-                                        client_sid = client.get("sid")
-                                        if client_username and client_sid:
-                                            encrypted_notification = encrypt_response(notification_data, client_username)
-                                            socketio.emit('update', encrypted_notification, to=client_sid)
-
-                    # Clean up the timer reference
-                    if timer_key in disconnection_timers:
-                        del disconnection_timers[timer_key]
-
-                except Exception :
-                    traceback.print_exc()
-
-            # Create and start the timer
-            disconnect_timer = threading.Timer(10.0, remove_player)
-            disconnect_timer.daemon = True
-            disconnection_timers[timer_key] = disconnect_timer
-            disconnect_timer.start()
+            schedule_removal(timer_key, DISCONNECT_GRACE_PERIOD, remove_disconnected_player,
+                             disconnected_username, disconnected_room)
 
         except Exception:
-            traceback.print_exc()
\ No newline at end of file
+            logger.exception("Error scheduling disconnect removal")
+
+
+def remove_disconnected_player(disconnected_username, disconnected_room):
+    """Removes a player who did not reconnect in time and notifies the remaining players."""
+    try:
+        room_ref = db.collection('rooms').document(disconnected_room)
+        removal = remove_from_room(db.transaction(), room_ref, disconnected_username)
+        invalidate_room(disconnected_room)
+
+        if removal is not None:
+            room_changed, _ = removal
+            if room_changed:
+                bump_version(disconnected_room, 'group1', 'group2', 'character_health')
+
+            # Notify remaining players
+            if room_changed and active_rooms.get(disconnected_room):
+                notification_data = {
+                    'type': 'player_left',
+                    'username': disconnected_username,
+                    'room_code': disconnected_room,
+                    'reason': 'disconnected'
+                }
+                broadcast('update', notification_data, disconnected_room)
+
+            # Forget the room if nobody is connected to it any more
+            if not active_rooms.get(disconnected_room):
+                free_room(disconnected_room)
+
+    except Exception:
+        logger.exception("Error removing disconnected player")
+
+
+@firestore.transactional
+def remove_from_room(transaction, room_ref, username):
+    """
+    Removes a player from a room in one field-level write, unless its game has ended.
+    Returns (room_changed, game_ended), or None if the room does not exist.
+    """
+    room_doc = room_ref.get(transaction=transaction)
+    if not room_doc.exists:
+        return None
+
+    room_data = room_doc.to_dict()
+    game_state = room_data.get('game_state', {})
+
+    # Only remove if game hasn't ended
+    if game_state.get('status') == 'ended':
+        return False, True
+
+    # Remove player from various room components
+    updates = {}
+    if username in room_data.get('players', []):
+        updates['players'] = firestore.ArrayRemove([username])
+    if username in room_data.get('ready_players', []):
+        updates['ready_players'] = firestore.ArrayRemove([username])
+    if username in game_state.get('player_order', []):
+        updates['game_state.player_order'] = firestore.ArrayRemove([username])
+
+    # Find and remove their character
+    for group in ['group1', 'group2']:
+        if username in room_data.get(group, {}):
+            updates[field_path(group, username)] = firestore.DELETE_FIELD
+
+    if not updates:
+        return False, False
+
+    # Remove their character's health, which is stored encrypted as a whole
+    character_health = room_data.get('character_health', {})
+    if isinstance(character_health, dict) and character_health.get("encrypted", False):
+        character_health = decrypt_from_database(character_health)
+    if username in character_health:
+        del character_health[username]
+        updates['character_health'] = encrypt_for_database(character_health)
+
+    transaction.update(room_ref, updates)
+    return True, False
+
+
+def free_room(room_code):
+    """Drops an empty room's in-memory server state, leaving its stored document untouched."""
+    active_rooms.pop(room_code, None)
+    active_turn_timers.pop(room_code, None)
+    invalidate_room(room_code)
+    forget_room(room_code)
+    forget_reconnect_buckets(room_code)
\ No newline at end of file
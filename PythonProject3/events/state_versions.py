@@ -0,0 +1,83 @@
+"""
+Per-room state versions used to send reconnecting players only what changed.
+
+Versions live in memory only. A room's first version is seeded from the clock, so
+versions handed out before a server restart are older than every tracked change
+and fall back to a full sync. The last serialized sync of each room is kept too,
+so players reconnecting at the same version share it.
+"""
+
+import threading
+import time
+
+# Room fields whose changes are tracked for reconnection deltas
+TRACKED_FIELDS = ('group1', 'group2', 'character_health', 'chat_log')
+
+_room_versions = {}          # Maps room codes to {'base', 'version', 'fields'} version records
+_sync_payloads = {}          # Maps room codes to the (key, payload) of their last serialized sync
+_versions_lock = threading.Lock()
+
+
+def _new_record():
+    """Creates a version record whose base is newer than any version issued before it."""
+    base = time.time_ns()
+    return {'base': base, 'version': base, 'fields': {}}
+
+
+def current_version(room_code):
+    """Returns the room's current state version, starting to track the room if needed."""
+    with _versions_lock:
+        record = _room_versions.get(room_code)
+        if record is None:
+            record = _room_versions[room_code] = _new_record()
+        return record['version']
+
+
+def bump_version(room_code, *fields):
+    """Records that the given fields of a room changed and returns the new version."""
+    with _versions_lock:
+        record = _room_versions.get(room_code)
+        if record is None:
+            record = _room_versions[room_code] = _new_record()
+        record['version'] += 1
+        for field in fields:
+            record['fields'][field] = record['version']
+        return record['version']
+
+
+def changed_since(room_code, client_version):
+    """
+    Returns the tracked fields that changed after client_version, or None if
+    the version is unknown to this server and a full sync is needed.
+    """
+    # The version comes from the client, anything but a plain int is treated as unknown
+    if not isinstance(client_version, int) or isinstance(client_version, bool):
+        return None
+
+    with _versions_lock:
+        record = _room_versions.get(room_code)
+        if record is None or not client_version:
+            return None
+        if client_version < record['base'] or client_version > record['version']:
+            return None
+        return [field for field, version in record['fields'].items() if version > client_version]
+
+
+def cached_sync_payload(room_code, key):
+    """Returns the room's last serialized sync if it was built for the same key, else None."""
+    cached = _sync_payloads.get(room_code)
+    if cached is None or cached[0] != key:
+        return None
+    return cached[1]
+
+
+def cache_sync_payload(room_code, key, payload):
+    """Keeps a room's serialized sync for reconnects at the same version, replacing the previous one."""
+    _sync_payloads[room_code] = (key, payload)
+
+
+def forget_room(room_code):
+    """Drops a room's versions and cached sync once it is freed."""
+    with _versions_lock:
+        _room_versions.pop(room_code, None)
+        _sync_payloads.pop(room_code, None)
\ No newline at end of file
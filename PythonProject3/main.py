@@ -2,6 +2,7 @@
 Application entry point for Fights in the Forest server.
 """
 
+from werkzeug.serving import WSGIRequestHandler
 from config import app, socketio
 
 import routes.auth_routes
@@ -10,5 +11,14 @@ import routes.room_routes
 import events.socket_handlers
 import events.game_handlers
 
+
+class NoDelayRequestHandler(WSGIRequestHandler):
+    """Development server request handler that sets TCP_NODELAY on every accepted connection."""
+
+    # Small one-shot emits are sent right away instead of waiting on Nagle's algorithm
+    disable_nagle_algorithm = True
+
+
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=8080, debug=True, use_reloader=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    socketio.run(app, host='0.0.0.0', port=8080, debug=True, use_reloader=False, allow_unsafe_werkzeug=True,
+                 request_handler=NoDelayRequestHandler)
\ No newline at end of file
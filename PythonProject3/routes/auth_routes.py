@@ -7,10 +7,13 @@ Provides secure endpoints for:
 - Encrypted request/response handling
 """
 
-import traceback
+import logging
 from flask import request, jsonify
 from config import app, db
-from security.encryption_utils import (encrypt_response, decrypt_request, hash_password, check_password, user_exists, hybrid_encryption)
+from security.encryption_utils import (decrypt_request, encode_password, hash_password, check_password, user_exists,
+                                       invalidate_public_key, hybrid_encryption)
+
+logger = logging.getLogger(__name__)
 
 
 @app.route('/register', methods=['POST'])
@@ -21,7 +24,7 @@ def register():
         credentials = decrypt_request(data)
 
         username = credentials.get('username')
-        password = credentials.get('password')
+        password = encode_password(credentials.get('password'))
         user_public_key = credentials.get('public_key')
 
         if user_exists(username):
@@ -45,6 +48,7 @@ def register():
             user_data['public_key'] = user_public_key
 
         db.collection("users").document(username).set(user_data)
+        invalidate_public_key(username)
 
         success_response = {"status": "success", "message": "User registered successfully."}
 
@@ -58,7 +62,7 @@ def register():
         return jsonify(hybrid_encryption.encrypt_symmetric(success_response))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /register")
         return jsonify({"status": "error", "message": "An error occurred during registration."}), 500
 
 
@@ -70,7 +74,7 @@ def login():
         credentials = decrypt_request(data)
 
         username = credentials.get('username')
-        password = credentials.get('password')
+        password = encode_password(credentials.get('password'))
         user_public_key = credentials.get('public_key')
 
         query = db.collection("users").where('username', '==', username).get()
@@ -105,6 +109,7 @@ def login():
             db.collection("users").document(username).update({
                 'public_key': user_public_key
             })
+            invalidate_public_key(username)
 
         success_response = {"status": "success", "message": "Login successful."}
 
@@ -118,5 +123,5 @@ def login():
         return jsonify(hybrid_encryption.encrypt_symmetric(success_response))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /login")
         return jsonify({"status": "error", "message": "An error occurred during login."}), 500
\ No newline at end of file
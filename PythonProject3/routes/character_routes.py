@@ -8,11 +8,15 @@ Handles:
 - Secure encryption of character data
 """
 
-import traceback
+import logging
 import uuid
 from flask import request, jsonify
 from config import app, db
-from security.encryption_utils import (encrypt_response, decrypt_request, encrypt_for_database, decrypt_from_database)
+from database.ability_store import load_abilities, get_ability_cached
+from security.encryption_utils import (encrypt_response, decrypt_request, encrypt_for_database, decrypt_from_database,
+                                       decrypt_many_from_database)
+
+logger = logging.getLogger(__name__)
 
 
 def get_characters_func(username):
@@ -21,37 +25,47 @@ def get_characters_func(username):
     collection_ref = user_ref.collection("characters")
     docs = collection_ref.stream()
 
-    characters = []
-    for doc in docs:
-        char_data = doc.to_dict()
+    characters = [doc.to_dict() for doc in docs]
 
-        if isinstance(char_data, dict) and char_data.get("encrypted", False):
-            decrypted_char = decrypt_from_database(char_data)
-            if 'unencrypted_name' in char_data:
-                decrypted_char['name'] = char_data['unencrypted_name']
-            characters.append(decrypted_char)
-        else:
-            characters.append(char_data)
+    # Decrypt all encrypted characters in one batch
+    encrypted_indexes = [i for i, char_data in enumerate(characters)
+                         if isinstance(char_data, dict) and char_data.get("encrypted", False)]
+    decrypted_chars = decrypt_many_from_database([characters[i] for i in encrypted_indexes])
+
+    for i, decrypted_char in zip(encrypted_indexes, decrypted_chars):
+        char_data = characters[i]
+        if 'unencrypted_name' in char_data:
+            decrypted_char['name'] = char_data['unencrypted_name']
+        characters[i] = decrypted_char
 
     return characters
 
 
-def get_character_func(username, name):
-    """Retrieve a specific character by name with decryption."""
+def decrypt_character(char_data):
+    """Decrypt a stored character document, restoring its unencrypted name."""
+    if isinstance(char_data, dict) and char_data.get("encrypted", False):
+        decrypted_char = decrypt_from_database(char_data)
+        if 'unencrypted_name' in char_data:
+            decrypted_char['name'] = char_data['unencrypted_name']
+        return decrypted_char
+    return char_data
+
+
+def get_character_func(username, name, character_id=None):
+    """Retrieve a specific character by id or name with decryption."""
     user_ref = db.collection("users").document(username)
     collection_ref = user_ref.collection("characters")
 
+    # Characters are stored under their id, so a known id is a single document read
+    if character_id:
+        doc = collection_ref.document(character_id).get()
+        if doc.exists:
+            return decrypt_character(doc.to_dict())
+
     character_docs = collection_ref.where('unencrypted_name', '==', name).limit(1).stream()
 
     for doc in character_docs:
-        char_data = doc.to_dict()
-
-        if isinstance(char_data, dict) and char_data.get("encrypted", False):
-            decrypted_char = decrypt_from_database(char_data)
-            decrypted_char['name'] = char_data['unencrypted_name']
-            return decrypted_char
-        else:
-            return char_data
+        return decrypt_character(doc.to_dict())
 
     # Fallback search if unencrypted name fails
     docs = collection_ref.stream()
@@ -88,23 +102,33 @@ def update_characters(username, new_data):
 
     updated_names = {char.get('name') for char in new_data}
 
+    written_ids = set()
+
     for char in new_data:
         char_name = char.get('name')
-        char_to_encrypt = char.copy()
 
-        encrypted_char = encrypt_for_database(char_to_encrypt)
+        # encrypt_for_database hands back the input itself if encryption fails, so copy before adding the name
+        encrypted_char = dict(encrypt_for_database(char))
         encrypted_char['unencrypted_name'] = char_name
 
-        if char_name in existing_characters:
-            doc_id = existing_characters[char_name]['id']
+        existing = existing_characters.get(char_name)
+        doc_id = char.get('id') or (existing['id'] if existing else None)
+
+        # Store characters under their own id so they can be read directly
+        if doc_id:
             characters_ref.document(doc_id).set(encrypted_char)
+            written_ids.add(doc_id)
         else:
             characters_ref.add(encrypted_char)
 
+        # Drop the old auto-id document once the character lives under its id
+        if existing and existing['id'] != doc_id:
+            characters_ref.document(existing['id']).delete()
+
     # Remove characters not in updated data
     for char_name in existing_characters:
-        if char_name not in updated_names:
-            doc_id = existing_characters[char_name]['id']
+        doc_id = existing_characters[char_name]['id']
+        if char_name not in updated_names and doc_id not in written_ids:
             characters_ref.document(doc_id).delete()
 
 
@@ -134,7 +158,7 @@ def get_characters():
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /get_characters")
         return jsonify({"status": "error", "message": "An error occurred during loading."}), 500
 
 
@@ -147,14 +171,15 @@ def get_character():
 
         username = request_json.get('username')
         name = request_json.get('name')
+        character_id = request_json.get('id')
 
-        character = get_character_func(username, name)
+        character = get_character_func(username, name, character_id)
 
         response_data = {"character": character}
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /get_character")
         return jsonify({"status": "error", "message": "An error occurred during loading."}), 500
 
 
@@ -178,28 +203,30 @@ def save_character():
             "abilities": character_data["abilities"],
         }
 
+        characters = get_characters_func(username)
+
         if character_index == -1:
             character["id"] = generate_unique_character_id(username)
         else:
-            characters = get_characters_func(username)
+            if character_index >= len(characters):
+                error_response = {"error": "Invalid character index"}
+                return jsonify(encrypt_response(error_response, username)), 400
             existing_character = characters[character_index]
             if "id" not in existing_character:
                 error_response = {"error": "Character id is missing"}
                 return jsonify(encrypt_response(error_response, username)), 400
             character["id"] = existing_character["id"]
 
-        characters = get_characters_func(username)
-        for i, h in enumerate(characters):
-            if i != character_index and h["name"].lower() == character["name"].lower():
-                error_response = {"error": "Character name already exists"}
-                return jsonify(encrypt_response(error_response, username)), 400
+        # Check for a case-insensitive name collision with another character
+        # (legacy data may hold names that differ only by case, so every character is checked)
+        lower_name = character["name"].lower()
+        if any(i != character_index and h["name"].lower() == lower_name for i, h in enumerate(characters)):
+            error_response = {"error": "Character name already exists"}
+            return jsonify(encrypt_response(error_response, username)), 400
 
         if character_index == -1:
             characters.append(character)
         else:
-            if character_index >= len(characters):
-                error_response = {"error": "Invalid character index"}
-                return jsonify(encrypt_response(error_response, username)), 400
             characters[character_index] = character
 
         # Update characters in the database
@@ -209,7 +236,7 @@ def save_character():
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /save_character")
         return jsonify({"status": "error", "message": "An error occurred saving character."}), 500
 
 
@@ -266,7 +293,7 @@ def delete_character():
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /delete_character")
         return jsonify({"status": "error", "message": "An error occurred deleting character."}), 500
 
 
@@ -279,16 +306,13 @@ def get_abilities():
 
         username = request_json.get('username')
 
-        col = db.collection("ability")
-        docs = col.stream()
-
-        abilities = [doc.to_dict().get("name") for doc in docs if "name" in doc.to_dict()]
+        abilities = list(load_abilities())
         response_data = {"abilities": abilities}
 
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /get_abilities")
         return jsonify({"status": "error", "message": "An error occurred fetching abilities."}), 500
 
 
@@ -306,13 +330,12 @@ def get_ability_details():
             error_response = {'error': 'Missing ability name or username'}
             return jsonify(encrypt_response(error_response, username)), 400
 
-        ability_docs = db.collection("ability").where('name', '==', ability_name).limit(1).get()
+        ability_data = get_ability_cached(ability_name)
 
-        if not ability_docs or len(ability_docs) == 0:
+        if ability_data is None:
             error_response = {'error': 'Ability not found'}
             return jsonify(encrypt_response(error_response, username)), 404
 
-        ability_data = ability_docs[0].to_dict()
         ability_type = ability_data.get("type", "")
         ability_desc = ability_data.get("desc", "")
         num_dice = ability_data.get("num", "")
@@ -328,5 +351,5 @@ def get_ability_details():
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /get_ability_details")
         return jsonify({"status": "error", "message": "An error occurred getting ability details."}), 500
\ No newline at end of file
@@ -8,69 +8,51 @@ Handles:
 - Room-related operations with secure encryption
 """
 
-import traceback
-import random
+import logging
+from firebase_admin import firestore
 from flask import request, jsonify
 from config import app, db, active_rooms
+from database.room_store import (field_path, create_room as create_room_document, get_room, invalidate_room)
 from security.encryption_utils import (encrypt_response, decrypt_request, encrypt_for_database)
-from routes.character_routes import get_characters_func
+from events.broadcast import broadcast
+from events.state_versions import bump_version
+
+logger = logging.getLogger(__name__)
 
 
 def remove_player_from_rooms(username):
-    """Remove player from all existing rooms."""
-    rooms = db.collection('rooms').stream()
+    """Remove player from every room they are in."""
+    # Only fetch rooms that list the player, using the players array index
+    rooms = db.collection('rooms').where('players', 'array_contains', username).stream()
     for room in rooms:
         room_data = room.to_dict()
-        room_changed = False
 
         # Remove player from various room components
-        if 'players' in room_data and username in room_data['players']:
-            room_data['players'].remove(username)
-            room_changed = True
+        updates = {'players': firestore.ArrayRemove([username])}
 
         for group in ['group1', 'group2']:
             if group in room_data and username in room_data[group]:
-                del room_data[group][username]
-                room_changed = True
+                updates[field_path(group, username)] = firestore.DELETE_FIELD
 
         if 'ready_players' in room_data and username in room_data['ready_players']:
-            room_data['ready_players'].remove(username)
-            room_changed = True
+            updates['ready_players'] = firestore.ArrayRemove([username])
 
         if 'game_state' in room_data and 'player_order' in room_data['game_state'] and username in \
                 room_data['game_state']['player_order']:
-            room_data['game_state']['player_order'].remove(username)
-            room_changed = True
-
-        # Update room if changes were made
-        if room_changed:
-            db.collection('rooms').document(room.id).set(room_data)
-
-            # Notify remaining players if any
-            if room.id in active_rooms:
-                notification_data = {
-                    'type': 'player_left',
-                    'username': username,
-                    'room_code': room.id
-                }
-
-                for client in active_rooms[room.id]:
-                    client_username = client.get("username")
-                    sid = client.get("sid")
-
-                    if client_username and sid:
-                        encrypted_notification = encrypt_response(notification_data, client_username)
-                        from config import socketio
-                        socketio.emit('update', encrypted_notification, to=sid)
-
-
-def generate_room_code():
-    """Generate a unique 4-digit room code."""
-    while True:
-        room_code = str(random.randint(1000, 9999))
-        room_ref = db.collection('rooms').document(room_code)
-        if not room_ref.get().exists:
-            return room_code
+            updates['game_state.player_order'] = firestore.ArrayRemove([username])
+
+        # Update the room in one write
+        room.reference.update(updates)
+        invalidate_room(room.id)
+        bump_version(room.id, 'group1', 'group2')
+
+        # Notify remaining players if any
+        notification_data = {
+            'type': 'player_left',
+            'username': username,
+            'room_code': room.id
+        }
+        broadcast('update', notification_data, room.id)
 
 
 @app.route('/join_room_route', methods=['POST'])
@@ -86,37 +68,31 @@ def join_room_route():
         # Remove player from any existing rooms
         remove_player_from_rooms(username)
 
-        room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+        room_data = get_room(room_code)
 
-        if not room_doc.exists:
+        if room_data is None:
             error_response = {'error': 'Room not found'}
             return jsonify(encrypt_response(error_response, username)), 404
 
-        room_data = room_doc.to_dict()
-
         # Check if game already started
         if room_data.get("game_state", {}).get("status") == 'started':
             error_response = {'error': 'Game already started'}
             return jsonify(encrypt_response(error_response, username)), 400
 
-        # Ensure players is a list and player is not already in room
-        if 'players' not in room_data:
-            room_data['players'] = []
-
-        if username in room_data['players']:
+        # Ensure player is not already in room
+        if username in room_data.get('players', []):
             error_response = {'error': 'Player already in the room'}
             return jsonify(encrypt_response(error_response, username)), 400
 
-        # Add player to room
-        room_data['players'].append(username)
-        room_ref.set(room_data)
+        # Add player to room atomically, so players joining together are all kept
+        db.collection('rooms').document(room_code).update({'players': firestore.ArrayUnion([username])})
+        invalidate_room(room_code)
 
         response_data = {'message': f'{username} joined room {room_code}'}
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /join_room_route")
         return jsonify({"status": "error", "message": "An error occurred joining room."}), 500
 
 
@@ -132,16 +108,11 @@ def create_room():
         # Remove player from any existing rooms
         remove_player_from_rooms(username)
 
-        # Generate unique room code
-        room_code = generate_room_code()
-
         # Encrypt character_health for initial storage
         character_health = encrypt_for_database({})
 
-        # Initialize room structure
-        room_ref = db.collection('rooms').document(room_code)
-        room_ref.set({
-            'code': room_code,
+        # Initialize room structure under a unique room code
+        room_code = create_room_document({
             'players': [username],
             'group1': {},
             'group2': {},
@@ -155,14 +126,14 @@ def create_room():
         })
 
         # Initialize the room in active_rooms
-        active_rooms[room_code] = []
+        active_rooms[room_code] = {}
 
         # Prepare the response data
         response_data = {'room_code': room_code}
         return jsonify(encrypt_response(response_data, username)), 201
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /create_room")
         return jsonify({"status": "error", "message": "Error creating room"}), 500
 
 
@@ -177,54 +148,42 @@ def remove_player_from_room():
         room_code = request_json.get('room_code')
 
         room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+        room_data = get_room(room_code)
 
-        if not room_doc.exists:
+        if room_data is None:
             error_response = {'error': 'Room not found'}
             return jsonify(encrypt_response(error_response, username)), 404
 
-        room_data = room_doc.to_dict()
-
-        # Remove player from room
-        room_changed = False
+        # Collect field-level removals for the player
+        updates = {}
         if username in room_data.get('players', []):
-            room_data['players'].remove(username)
-            room_changed = True
+            updates['players'] = firestore.ArrayRemove([username])
 
         for group in ['group1', 'group2']:
             if group in room_data and username in room_data[group]:
-                del room_data[group][username]
-                room_changed = True
+                updates[field_path(group, username)] = firestore.DELETE_FIELD
 
         if 'ready_players' in room_data and username in room_data['ready_players']:
-            room_data['ready_players'].remove(username)
-            room_changed = True
+            updates['ready_players'] = firestore.ArrayRemove([username])
 
-        if room_changed:
-            room_ref.set(room_data)
+        if updates:
+            room_ref.update(updates)
+            invalidate_room(room_code)
+            bump_version(room_code, 'group1', 'group2')
 
             # Emit update event to all clients in the room
-            if room_code in active_rooms:
-                notification_data = {
-                    'type': 'player_removed',
-                    'username': username,
-                    'room_code': room_code
-                }
-
-                for client in active_rooms[room_code]:
-                    client_username = client.get("username")
-                    sid = client.get("sid")
-
-                    if client_username and sid:
-                        encrypted_notification = encrypt_response(notification_data, client_username)
-                        from config import socketio
-                        socketio.emit('update', encrypted_notification, to=sid)
+            notification_data = {
+                'type': 'player_removed',
+                'username': username,
+                'room_code': room_code
+            }
+            broadcast('update', notification_data, room_code)
 
         response_data = {'message': f'Player {username} removed from room {room_code}'}
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /remove_player_from_room")
         return jsonify({"status": "error", "message": "An error occurred removing player from room."}), 500
 
 
@@ -238,14 +197,12 @@ def get_group1():
         room_code = request_json.get('room_code')
         username = request_json.get('username')
 
-        room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+        room_data = get_room(room_code)
 
-        if not room_doc.exists:
+        if room_data is None:
             error_response = {'error': 'Room not found'}
             return jsonify(encrypt_response(error_response, username)), 404
 
-        room_data = room_doc.to_dict()
         group1 = room_data.get('group1', {})
 
         characters = []
@@ -260,7 +217,7 @@ def get_group1():
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /get_group1")
         return jsonify({"status": "error", "message": "An error occurred getting group1 data."}), 500
 
 
@@ -274,14 +231,12 @@ def get_group2():
         room_code = request_json.get('room_code')
         username = request_json.get('username')
 
-        room_ref = db.collection('rooms').document(room_code)
-        room_doc = room_ref.get()
+        room_data = get_room(room_code)
 
-        if not room_doc.exists:
+        if room_data is None:
             error_response = {'error': 'Room not found'}
             return jsonify(encrypt_response(error_response, username)), 404
 
-        room_data = room_doc.to_dict()
         group2 = room_data.get('group2', {})
 
         characters = []
@@ -296,5 +251,5 @@ def get_group2():
         return jsonify(encrypt_response(response_data, username))
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Error in /get_group2")
         return jsonify({"status": "error", "message": "An error occurred getting group2 data."}), 500
\ No newline at end of file
@@ -5,23 +5,31 @@ Security package initialization for encryption utilities.
 from .hybrid_encryption import HybridEncryption
 from .encryption_utils import (
     encrypt_response,
+    encrypt_for_recipients,
     decrypt_request,
     encrypt_for_database,
     decrypt_from_database,
+    decrypt_many_from_database,
+    encode_password,
     hash_password,
     check_password,
     user_exists,
-    get_public_key
+    get_public_key,
+    invalidate_public_key
 )
 
 __all__ = [
     'HybridEncryption',
     'encrypt_response',
+    'encrypt_for_recipients',
     'decrypt_request',
     'encrypt_for_database',
     'decrypt_from_database',
+    'decrypt_many_from_database',
+    'encode_password',
     'hash_password',
     'check_password',
     'user_exists',
-    'get_public_key'
+    'get_public_key',
+    'invalidate_public_key'
 ]
\ No newline at end of file
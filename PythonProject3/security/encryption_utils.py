@@ -9,16 +9,35 @@ Provides functions for:
 """
 
 import base64
-import json
+import time
 import bcrypt
-import traceback
+import orjson
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from Cryptodome.PublicKey import RSA
 from security.hybrid_encryption import HybridEncryption
 from config import db
 
+logger = logging.getLogger(__name__)
+
+# bcrypt ignores anything past this many bytes of the password
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+# Seconds a user's public key is served from memory before re-reading it
+PUBLIC_KEY_CACHE_TTL = 300
+
+# Maps usernames to (expiry time, public key or None)
+_public_key_cache = {}
+
 # Initialize hybrid encryption
 hybrid_encryption = HybridEncryption()
 
+# Worker pool for independent cipher operations (PyCryptodome releases the GIL)
+crypto_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="crypto")
+
+# Recipients per event from which RSA key wraps are spread across the crypto pool
+PARALLEL_WRAP_THRESHOLD = 4
+
 def load_key(file_path):
     """Loads an RSA key from a base64 encoded file."""
     with open(file_path, "r") as file:
@@ -32,26 +51,45 @@ public_key = load_key("raw/public.txt")
 
 
 def get_public_key(username):
-    """Retrieves a user's public key from the database for encryption."""
+    """Retrieves a user's public key for encryption, using the in-memory cache when fresh."""
+    if username is None:
+        return None
+
+    cached = _public_key_cache.get(username)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
     try:
-        if username is None:
-            return None
+        user_public_key = _fetch_public_key(username)
+    except Exception:
+        # A failed read says nothing about the key, so it is not cached and the next call retries
+        logger.exception("Could not read the public key of %s", username)
+        return None
 
-        user_docs = db.collection("users").where('username', '==', username).get()
+    # Only a confirmed key or confirmed absence of one is cached
+    _public_key_cache[username] = (time.monotonic() + PUBLIC_KEY_CACHE_TTL, user_public_key)
+    return user_public_key
 
-        if not user_docs or len(user_docs) == 0:
-            return None
 
-        user_doc = user_docs[0].to_dict()
+def invalidate_public_key(username):
+    """Drops a cached public key after the user's stored key changes."""
+    _public_key_cache.pop(username, None)
 
-        if 'public_key' not in user_doc or not user_doc['public_key']:
-            return None
 
-        return user_doc['public_key']
+def _fetch_public_key(username):
+    """Reads a user's public key from the database, returning None if they have none. Read errors are raised."""
+    user_docs = db.collection("users").where('username', '==', username).get()
 
-    except Exception:
+    if not user_docs or len(user_docs) == 0:
+        return None
+
+    user_doc = user_docs[0].to_dict()
+
+    if 'public_key' not in user_doc or not user_doc['public_key']:
         return None
 
+    return user_doc['public_key']
+
 
 def encrypt_response(response_data, username=None):
     """Encrypts response data using the user's public key or symmetric encryption as fallback."""
@@ -66,35 +104,71 @@ def encrypt_response(response_data, username=None):
     return hybrid_encryption.encrypt_symmetric(response_data)
 
 
+def encrypt_for_recipients(response_data, usernames):
+    """
+    Encrypts the same response for several users, running the AES step only once.
+    Returns a dict mapping each username to its encrypted package.
+    """
+    recipients = {}
+    symmetric_users = []
+    for username in dict.fromkeys(usernames):
+        if not username:
+            continue
+        user_public_key = get_public_key(username)
+        if user_public_key:
+            recipients[username] = user_public_key
+        else:
+            symmetric_users.append(username)
+
+    # Serialize once, the hybrid and symmetric paths both encrypt the same bytes
+    if isinstance(response_data, dict):
+        response_data = orjson.dumps(response_data, option=orjson.OPT_NON_STR_KEYS)
+
+    packages = {}
+    if recipients:
+        # Small rooms wrap inline, the pool hand-off would cost more than it saves
+        map_func = crypto_pool.map if len(recipients) >= PARALLEL_WRAP_THRESHOLD else map
+        hybrid_packages = hybrid_encryption.encrypt_with_public_keys(response_data, list(recipients.values()), map_func)
+        packages.update(zip(recipients, hybrid_packages))
+
+    # Users without a public key all share the same symmetric package
+    if symmetric_users:
+        symmetric_package = hybrid_encryption.encrypt_symmetric(response_data)
+        packages.update((username, symmetric_package) for username in symmetric_users)
+
+    return packages
+
+
 def decrypt_request(request_data):
     """Decrypts incoming request data using appropriate decryption method."""
     try:
-        method = request_data.get("method", "")
+        method = request_data.get("method")
 
         if method == "hybrid-rsa-aes":
             encrypted_key = request_data.get("encrypted_key")
             iv = request_data.get("iv")
             encrypted_data = request_data.get("data")
 
-            if not all([encrypted_key, iv, encrypted_data]):
-                raise
+            if not (encrypted_key and iv and encrypted_data):
+                raise ValueError("Incomplete hybrid request")
 
             decrypted_data = hybrid_encryption.decrypt_hybrid_request(
                 encrypted_key, iv, encrypted_data, private_key
             )
 
+            # Any JSON value is parsed, text that is not JSON is returned as-is
             try:
-                return json.loads(decrypted_data)
-            except json.JSONDecodeError:
+                return orjson.loads(decrypted_data)
+            except orjson.JSONDecodeError:
                 return decrypted_data
 
-        elif "data" in request_data and request_data.get("encrypted", True):
+        if "data" in request_data and request_data.get("encrypted", True):
             return hybrid_encryption.decrypt_symmetric(request_data)
 
         return request_data
 
     except Exception:
-        traceback.print_exc()
+        logger.exception("Request decryption failed")
 
 
 def encrypt_for_database(data):
@@ -106,7 +180,7 @@ def encrypt_for_database(data):
             "data": encrypted["data"]
         }
     except Exception:
-        traceback.print_exc()
+        logger.exception("Database encryption failed")
         return data
 
 
@@ -117,18 +191,30 @@ def decrypt_from_database(encrypted_data):
             return hybrid_encryption.decrypt_symmetric(encrypted_data)
         return encrypted_data
     except Exception:
-        traceback.print_exc()
+        logger.exception("Database decryption failed")
         return encrypted_data
 
 
+def decrypt_many_from_database(encrypted_items):
+    """Decrypts several database entries at once, spreading the work across the crypto pool."""
+    if len(encrypted_items) <= 1:
+        return [decrypt_from_database(item) for item in encrypted_items]
+    return list(crypto_pool.map(decrypt_from_database, encrypted_items))
+
+
+def encode_password(password):
+    """Encodes a password once for bcrypt, which only uses the first 72 bytes."""
+    return password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+
+
 def hash_password(password):
-    """Hashes a password using bcrypt."""
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    """Hashes an encoded password using bcrypt."""
+    return bcrypt.hashpw(password, bcrypt.gensalt()).decode()
 
 
 def check_password(stored_hash, password):
-    """Verifies a password against its stored hash."""
-    return bcrypt.checkpw(password.encode(), stored_hash.encode())
+    """Verifies an encoded password against its stored hash."""
+    return bcrypt.checkpw(password, stored_hash.encode())
 
 
 def user_exists(username):
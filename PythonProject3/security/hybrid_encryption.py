@@ -12,8 +12,17 @@ from Cryptodome.PublicKey import RSA
 from Cryptodome.Random import get_random_bytes
 from Cryptodome.Util.Padding import pad, unpad
 import base64
-import json
-import traceback
+import functools
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Number of decrypted symmetric payloads kept in memory
+DECRYPT_CACHE_SIZE = 1024
+
+# Number of parsed recipient public keys kept in memory
+PUBLIC_KEY_CACHE_SIZE = 4096
 
 
 class HybridEncryption:
@@ -27,27 +36,30 @@ class HybridEncryption:
         self.symmetric_key = symmetric_key[:16].ljust(16, b'\0')
         self.symmetric_iv = symmetric_iv[:16].ljust(16, b'\0')
 
+        # Symmetric ciphertexts are deterministic, so their plaintext can be reused
+        self._decrypt_symmetric_text = functools.lru_cache(maxsize=DECRYPT_CACHE_SIZE)(
+            self._decrypt_symmetric_text_uncached
+        )
+
+        # (private key, PKCS#1 v1.5 cipher) used for incoming requests
+        self._private_key_cipher = None
+
+        # Parsing a PEM key is far costlier than the RSA wrap itself, so reuse parsed keys
+        self._public_key_cipher = functools.lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)(
+            self._public_key_cipher_uncached
+        )
+
     def encrypt_with_public_key(self, data, public_key_str):
         """Encrypts data using RSA for the key and AES for the content."""
         try:
-            # Convert data to JSON string if dictionary
+            # Serialize dictionaries straight to JSON bytes
             if isinstance(data, dict):
-                data = json.dumps(data)
+                data = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
 
             # Convert string data to bytes
             if isinstance(data, str):
                 data = data.encode('utf-8')
 
-            # Normalize the key format
-            if not public_key_str.startswith('-----BEGIN PUBLIC KEY-----'):
-                pem_key = "-----BEGIN PUBLIC KEY-----\n"
-                for i in range(0, len(public_key_str), 64):
-                    pem_key += public_key_str[i:i + 64] + "\n"
-                pem_key += "-----END PUBLIC KEY-----"
-                public_key_str = pem_key
-
-            # Import the public key
-            public_key = RSA.import_key(public_key_str)
             # Generate a random AES key
             aes_key = get_random_bytes(16)
 
@@ -58,7 +70,7 @@ class HybridEncryption:
             encrypted_data = cipher_aes.encrypt(padded_data)
 
             # Encrypt the AES key with RSA using PKCS#1 v1.5 padding to match Android client
-            cipher_rsa = PKCS1_v1_5.new(public_key)
+            cipher_rsa = self._public_key_cipher(public_key_str)
             encrypted_key = cipher_rsa.encrypt(aes_key)
 
             # Base64 encode everything for transmission and add encryption method identifier
@@ -71,10 +83,73 @@ class HybridEncryption:
             }
 
         except Exception:
-            traceback.print_exc()
+            logger.exception("Hybrid encryption failed, falling back to symmetric encryption")
             # Fall back to symmetric encryption
             return self.encrypt_symmetric(data)
 
+    def encrypt_with_public_keys(self, data, public_key_strs, map_func=map):
+        """
+        Encrypts data once with AES and wraps that AES key for each RSA public key.
+        Returns one hybrid package per key, all sharing the same IV and ciphertext.
+        The per-key wraps are run through map_func, e.g. an executor's map.
+        """
+        # Serialize dictionaries straight to JSON bytes
+        if isinstance(data, dict):
+            data = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+        # Convert string data to bytes
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        # Encrypt the data a single time with a fresh AES key
+        aes_key = get_random_bytes(16)
+        cipher_aes = AES.new(aes_key, AES.MODE_CBC)
+        iv = base64.b64encode(cipher_aes.iv).decode('utf-8')
+        encrypted_data = base64.b64encode(cipher_aes.encrypt(pad(data, AES.block_size))).decode('utf-8')
+
+        def wrap_for(public_key_str):
+            """Builds one recipient's package, only the AES key is encrypted per recipient."""
+            try:
+                cipher_rsa = self._public_key_cipher(public_key_str)
+                encrypted_key = cipher_rsa.encrypt(aes_key)
+                return {
+                    "encrypted": True,
+                    "method": "hybrid-rsa-aes",
+                    "encrypted_key": base64.b64encode(encrypted_key).decode('utf-8'),
+                    "iv": iv,
+                    "data": encrypted_data
+                }
+            except Exception:
+                logger.exception("RSA key wrap failed, falling back to symmetric encryption")
+                # Fall back to symmetric encryption for this recipient
+                return self.encrypt_symmetric(data)
+
+        return list(map_func(wrap_for, public_key_strs))
+
+    def _public_key_cipher_uncached(self, public_key_str):
+        """Builds the PKCS#1 v1.5 cipher for a recipient's public key."""
+        return PKCS1_v1_5.new(self._import_public_key(public_key_str))
+
+    def _import_public_key(self, public_key_str):
+        """Imports an RSA public key given as PEM or as a bare Base64 body."""
+        # Normalize the key format
+        if not public_key_str.startswith('-----BEGIN PUBLIC KEY-----'):
+            pem_key = "-----BEGIN PUBLIC KEY-----\n"
+            for i in range(0, len(public_key_str), 64):
+                pem_key += public_key_str[i:i + 64] + "\n"
+            pem_key += "-----END PUBLIC KEY-----"
+            public_key_str = pem_key
+
+        return RSA.import_key(public_key_str)
+
+    def _private_cipher_for(self, private_key):
+        """Returns the PKCS#1 v1.5 cipher for the server's private key, building it only once."""
+        cached = self._private_key_cipher
+        if cached is None or cached[0] is not private_key:
+            cached = (private_key, PKCS1_v1_5.new(private_key))
+            self._private_key_cipher = cached
+        return cached[1]
+
     def decrypt_hybrid_request(self, encrypted_key_base64, iv_base64, encrypted_data_base64, private_key):
         """Decrypts a message that used hybrid RSA/AES encryption."""
         try:
@@ -84,7 +159,7 @@ class HybridEncryption:
             encrypted_data = base64.b64decode(encrypted_data_base64)
 
             # Decrypt the AES key with the server's private RSA key
-            cipher_rsa = PKCS1_v1_5.new(private_key)
+            cipher_rsa = self._private_cipher_for(private_key)
             sentinel = get_random_bytes(16)
             aes_key = cipher_rsa.decrypt(encrypted_key, sentinel)
 
@@ -102,14 +177,14 @@ class HybridEncryption:
             return decrypted_data.decode('utf-8')
 
         except Exception:
-            traceback.print_exc()
+            logger.exception("Hybrid request decryption failed")
 
     def encrypt_symmetric(self, data):
         """Encrypts data with symmetric AES."""
         try:
-            # Convert to JSON string if it's a dictionary
+            # Serialize dictionaries straight to JSON bytes
             if isinstance(data, dict):
-                data = json.dumps(data)
+                data = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
 
             # Convert to bytes if it's a string
             if isinstance(data, str):
@@ -146,20 +221,23 @@ class HybridEncryption:
             else:
                 data = encrypted_data
 
-            # Decode from Base64
-            binary_data = base64.b64decode(data)
+            # Parse on every call so callers always get their own objects
+            return orjson.loads(self._decrypt_symmetric_text(data))
 
-            # Create cipher
-            cipher = AES.new(self.symmetric_key, AES.MODE_CBC, self.symmetric_iv)
+        except Exception:
+            raise
 
-            # Decrypt and unpad
-            decrypted_padded = cipher.decrypt(binary_data)
-            decrypted_data = unpad(decrypted_padded, AES.block_size)
+    def _decrypt_symmetric_text_uncached(self, data):
+        """Decrypts Base64 symmetric ciphertext to its plaintext string."""
+        # Decode from Base64
+        binary_data = base64.b64decode(data)
 
-            # Convert to string
-            decrypted_str = decrypted_data.decode('utf-8')
+        # Create cipher
+        cipher = AES.new(self.symmetric_key, AES.MODE_CBC, self.symmetric_iv)
 
-            return json.loads(decrypted_str)
+        # Decrypt and unpad
+        decrypted_padded = cipher.decrypt(binary_data)
+        decrypted_data = unpad(decrypted_padded, AES.block_size)
 
-        except Exception:
-            raise
\ No newline at end of file
+        # Convert to string
+        return decrypted_data.decode('utf-8')
\ No newline at end of file